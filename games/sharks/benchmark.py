@@ -0,0 +1,337 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import platform
+import tracemalloc
+import argparse
+
+# Benchmarks always render off-screen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import sharks
+
+ENEMY_MIX = ['shark', 'shark', 'piranha', 'jellyfish', 'eel', 'hammerhead', 'crab', 'octopus']
+ALL_WEAPONS = ['harpoon', 'trident', 'net', 'torpedo']
+
+# ============= SCENARIOS =============
+class DenseObstacleGame(sharks.Game):
+    # Every streamed chunk gets a packed field of extra coral and rock
+    extra_per_chunk = 40
+
+    def generate_obstacles_in_chunk(self, chunk_x, chunk_y):
+        if (chunk_x, chunk_y) in self.loaded_chunks:
+            return
+        super().generate_obstacles_in_chunk(chunk_x, chunk_y)
+        rng = random.Random(f"{self.seed}:chunk:{chunk_x}:{chunk_y}:dense")
+        base_x = chunk_x * sharks.CHUNK_SIZE
+        base_y = chunk_y * sharks.CHUNK_SIZE
+        for _ in range(self.extra_per_chunk):
+            w = rng.randint(20, 60)
+            h = rng.randint(20, 60)
+            x = base_x + rng.randint(0, sharks.CHUNK_SIZE - w)
+            y = base_y + rng.randint(0, sharks.CHUNK_SIZE - h)
+            # Keep the spawn area clear so the player can still move
+            if abs(x) < 300 and abs(y) < 300:
+                continue
+            self.obstacles.add(sharks.Obstacle(x, y, w, h, rng.choice(['coral', 'rock', 'seaweed'])))
+
+# Set from --no-numpy; None lets Game pick the NumPy store when available
+VECTORIZED = None
+# Set from --quality; recorded in the results metadata
+QUALITY = 'high'
+
+def make_game(seed, game_class=sharks.Game):
+    game = game_class(sharks.WanderController(seed), seed=seed, vectorized=VECTORIZED)
+    # Scenarios measure the hot loops, not how long the player survives
+    game.player.max_hp = game.player.hp = 10 ** 12
+    return game
+
+def add_weapons(game, level):
+    for weapon_type in ALL_WEAPONS:
+        for _ in range(level):
+            game.player.add_weapon(weapon_type)
+
+def scatter_enemies(game, count, rng, min_dist=150, max_dist=1800, types=ENEMY_MIX):
+    for _ in range(count):
+        angle = rng.uniform(0, 2 * math.pi)
+        dist = rng.uniform(min_dist, max_dist)
+        game.add_enemy(sharks.Enemy(
+            game.player.x + math.cos(angle) * dist,
+            game.player.y + math.sin(angle) * dist,
+            rng.choice(types),
+            is_elite=rng.random() < 0.1,
+            difficulty_scale=2.0,
+            rng=rng,
+        ))
+
+def crowd(count):
+    def build(seed):
+        game = make_game(seed)
+        game.time = 3000
+        scatter_enemies(game, count, random.Random(seed))
+        return game
+    return build
+
+def projectile_storm(seed):
+    game = make_game(seed)
+    game.time = 3000
+    add_weapons(game, 8)
+    # Every weapon fires each tick at a crowd held back at range, so hundreds
+    # of projectiles are in flight at once
+    for weapon in game.player.weapons:
+        weapon.cooldown = 1
+        weapon.pierce += 5
+    scatter_enemies(game, 1500, random.Random(seed), min_dist=500, max_dist=1400)
+    return game
+
+def dense_obstacles(seed):
+    game = make_game(seed, DenseObstacleGame)
+    game.time = 3000
+    add_weapons(game, 3)
+    scatter_enemies(game, 300, random.Random(seed))
+    return game
+
+def boss_fight(seed):
+    game = make_game(seed)
+    game.time = 3000
+    add_weapons(game, 2)
+    rng = random.Random(seed)
+    for i in range(6):
+        angle = i * math.pi / 3
+        boss = sharks.Enemy(math.cos(angle) * 600, math.sin(angle) * 600,
+                            ['megalodon', 'kraken'][i % 2], is_boss=True,
+                            difficulty_scale=4.0, rng=rng)
+        # Long fight: bosses soak damage for the whole run
+        boss.hp = boss.max_hp = boss.max_hp * 1000
+        game.add_enemy(boss)
+    scatter_enemies(game, 200, rng)
+    return game
+
+def gem_field(seed):
+    # A long run's worth of uncollected XP scattered around the player
+    game = make_game(seed)
+    game.time = 3000
+    rng = random.Random(seed)
+    for _ in range(5000):
+        game.add_gem(game.gem_pool.acquire(rng.uniform(-1500, 1500), rng.uniform(-1500, 1500),
+                                           rng.randint(1, 20), rng))
+    scatter_enemies(game, 200, rng)
+    return game
+
+# name -> (builder, default measured ticks)
+SCENARIOS = {
+    'crowd_500': (crowd(500), 600),
+    'crowd_2000': (crowd(2000), 300),
+    'crowd_10000': (crowd(10000), 100),
+    'projectile_storm': (projectile_storm, 600),
+    'dense_obstacles': (dense_obstacles, 600),
+    'boss_fight': (boss_fight, 1200),
+    'gem_field': (gem_field, 600),
+}
+
+# ============= RUNNER =============
+def run_scenario(name, ticks=None, warmup=30, seed=1, draw=True, quality='high'):
+    build, default_ticks = SCENARIOS[name]
+    ticks = ticks if ticks is not None else default_ticks
+    game = build(seed)
+    game.rebuild_enemy_index()
+    # Pinned, so timings compare across runs and machines
+    game.quality.pin(sharks.QUALITY_NAMES.index(quality))
+
+    def step():
+        if game.show_level_up:
+            game.handle_level_up_choice(game.controller.choose_level_up(game))
+        game.update()
+        game.player.hp = game.player.max_hp
+        if draw:
+            game.draw()
+
+    for _ in range(warmup):
+        step()
+    # Sprite atlases queued during the warm-up are finished here, so the
+    # measured frames draw from them rather than procedurally
+    sharks.enemy_atlas.work(float('inf'))
+
+    profiler = sharks.FrameProfiler(window=None)
+    game.profiler = profiler
+    frame_times = []
+    peak = {'enemies': 0, 'projectiles': 0, 'xp_gems': 0, 'obstacles': 0}
+    for _ in range(ticks):
+        start = time.perf_counter()
+        step()
+        frame_times.append((time.perf_counter() - start) * 1000)
+        peak['enemies'] = max(peak['enemies'], len(game.enemies))
+        peak['projectiles'] = max(peak['projectiles'], len(game.projectiles))
+        peak['xp_gems'] = max(peak['xp_gems'], len(game.xp_gems))
+        peak['obstacles'] = max(peak['obstacles'], len(game.obstacles))
+
+    result = profiler.summary()
+    result['frame'] = sharks.FrameProfiler.stats(frame_times)
+    result['ticks'] = ticks
+    result['peak_entities'] = peak
+    result['pools'] = {name: {'hits': pool.hits, 'misses': pool.misses}
+                       for name, pool in (('projectile', game.projectile_pool), ('gem', game.gem_pool))}
+    result['state'] = game.state_digest()
+    return result
+
+# ============= MEMORY =============
+def entity_factories():
+    rng = random.Random(0)
+    weapon = sharks.Weapon('harpoon')
+    return {
+        'Vector2': lambda: sharks.Vector2(rng.random(), rng.random()),
+        'Projectile': lambda: sharks.Projectile(0.0, 0.0, rng.uniform(-100, 100), 50.0, weapon),
+        'Enemy': lambda: sharks.Enemy(rng.uniform(-1000, 1000), rng.uniform(-1000, 1000),
+                                      rng.choice(ENEMY_MIX), rng=rng),
+        'XPGem': lambda: sharks.XPGem(rng.uniform(-1000, 1000), rng.uniform(-1000, 1000), 5, rng),
+        'Chest': lambda: sharks.Chest(rng.uniform(-1000, 1000), rng.uniform(-1000, 1000)),
+        'Shrine': lambda: sharks.Shrine(rng.uniform(-1000, 1000), rng.uniform(-1000, 1000)),
+        'Obstacle': lambda: sharks.Obstacle(rng.randint(-1000, 1000), rng.randint(-1000, 1000), 40, 40),
+    }
+
+def bytes_per_entity(factory, count=10000):
+    # Traced bytes for count live instances, less the list holding them
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [factory() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before - sys.getsizeof(items)) / len(items)
+
+def crowd_heap(count, seed, ticks=60):
+    # Heap traced while building and simulating a game with count enemies
+    tracemalloc.start()
+    game = make_game(seed)
+    game.time = 3000
+    scatter_enemies(game, count, random.Random(seed))
+    for _ in range(ticks):
+        game.update()
+        game.player.hp = game.player.max_hp
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'enemies': len(game.enemies), 'heap_bytes': current, 'peak_bytes': peak}
+
+def run_memory(seed=1, crowd_sizes=(0, 1000, 10000)):
+    result = {'bytes_per_entity': {name: bytes_per_entity(factory)
+                                   for name, factory in entity_factories().items()}}
+    crowds = {count: crowd_heap(count, seed) for count in crowd_sizes}
+    base = crowds.get(0, {'heap_bytes': 0})['heap_bytes']
+    for count, crowd in crowds.items():
+        if count:
+            crowd['bytes_per_enemy'] = (crowd['heap_bytes'] - base) / count
+    result['crowds'] = {str(count): crowd for count, crowd in crowds.items()}
+    return result
+
+def print_memory(result):
+    print("memory:")
+    for name, size in result['bytes_per_entity'].items():
+        print(f"  {name:12} {size:8.0f} bytes/entity")
+    for count, crowd in result['crowds'].items():
+        line = (f"  crowd {count:>6}: heap {crowd['heap_bytes'] / 2 ** 20:7.2f}MB  "
+                f"peak {crowd['peak_bytes'] / 2 ** 20:7.2f}MB")
+        if 'bytes_per_enemy' in crowd:
+            line += f"  {crowd['bytes_per_enemy']:.0f} bytes/enemy"
+        print(line)
+
+def metadata():
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'numpy': sharks.np.__version__ if sharks.np is not None and VECTORIZED is not False else None,
+        'atlas': sharks.enemy_atlas.enabled,
+        'quality': QUALITY,
+    }
+
+def print_result(name, result):
+    frame = result['frame']
+    print(f"{name}: {result['ticks']} ticks, frame p50 {frame['p50']:.2f}ms "
+          f"p99 {frame['p99']:.2f}ms, peak enemies {result['peak_entities']['enemies']}")
+    for section in ('update', 'draw'):
+        for phase, stats in result[section].items():
+            print(f"  {section:6} {phase:20} p50 {stats['p50']:8.3f}ms  "
+                  f"p90 {stats['p90']:8.3f}ms  p99 {stats['p99']:8.3f}ms")
+
+def compare(results, baseline, threshold):
+    # Flags any phase whose p50 grew by more than threshold (a ratio) and by
+    # at least 0.05ms, so noise in near-zero phases is ignored
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            continue
+        checks = [('frame', 'total', result['frame'], old['frame'])]
+        for section in ('update', 'draw'):
+            for phase, stats in result[section].items():
+                if phase in old.get(section, {}):
+                    checks.append((section, phase, stats, old[section][phase]))
+        for section, phase, new_stats, old_stats in checks:
+            before, after = old_stats['p50'], new_stats['p50']
+            if after > before * threshold and after - before > 0.05:
+                regressions.append(f"{name} {section}/{phase}: p50 {before:.3f}ms -> {after:.3f}ms")
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Shark Survivors benchmark suite")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated scenarios to run (default: all)")
+    parser.add_argument("--ticks", type=int, default=None,
+                        help="measured ticks per scenario (default: per scenario)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-draw", action="store_true", help="time the simulation only")
+    parser.add_argument("--no-numpy", action="store_true", help="use the pure-Python enemy update")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="JSON file to write results to")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="p50 ratio counted as a regression with --compare")
+    parser.add_argument("--no-atlas", action="store_true",
+                        help="draw enemies procedurally instead of from sprite atlases")
+    parser.add_argument("--quality", choices=sharks.QUALITY_NAMES, default='high',
+                        help="render quality level to draw at (default: high)")
+    parser.add_argument("--memory", action="store_true",
+                        help="also report bytes per entity and heap size for 1k/10k enemy crowds")
+    args = parser.parse_args(argv)
+    global VECTORIZED, QUALITY
+    if args.no_numpy:
+        VECTORIZED = False
+    QUALITY = args.quality
+    sharks.enemy_atlas.enabled = not args.no_atlas
+
+    sharks.init_display()
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        results[name] = run_scenario(name, args.ticks, seed=args.seed, draw=not args.no_draw,
+                                     quality=args.quality)
+        print_result(name, results[name])
+
+    output = {'meta': metadata(), 'scenarios': results}
+    if args.memory:
+        output['memory'] = run_memory(args.seed)
+        print_memory(output['memory'])
+
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print("REGRESSION " + line)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
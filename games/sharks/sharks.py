@@ -1,12 +1,50 @@
 import pygame
 import random
 import math
+import sys
+import time
+import argparse
+import hashlib
+import json
+import marshal
+import os
+from collections import OrderedDict, deque
 
-pygame.init()
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Constants
 WIDTH, HEIGHT = 1200, 800
-FPS = 60
+DEBUG_PANEL_RECT = (WIDTH - 280, 100, 270, 660)  # x, y, width, height
+FPS = 60                  # simulation ticks per second
+SIM_DT = 1.0 / FPS
+RENDER_FPS = 120          # render frame cap, independent of the tick rate (0 = uncapped)
+MAX_FRAME_TIME = 0.25     # longest frame fed to the tick accumulator
+MAX_TICKS_PER_FRAME = 5   # catch-up cap before the backlog is dropped
+CHUNK_SIZE = 500
+CHUNK_LOAD_RADIUS = 3    # chunks generated around the player
+CHUNK_UNLOAD_RADIUS = 4  # chunks further than this (~2000px) are dropped
+ENEMY_GRID_CELL_SIZE = 128
+NUMPY_CROWD_THRESHOLD = 250    # live enemies, projectiles and gems before the NumPy stores take over
+OBSTACLE_GRID_CELL_SIZE = 128  # cells of the batched projectile-vs-obstacle test
+GEM_COALESCE_CELL = 48        # gems sharing a cell this size may merge into one...
+GEM_COALESCE_MIN_GEMS = 3     # ...once the cell holds at least this many
+GEM_COALESCE_INTERVAL = 30    # ticks between merge passes
+GEM_MAGNET_SPEED = 10
+VIEW_MARGIN = 32  # px past the screen edge still drawn; covers interpolation
+LOD_FULL, LOD_SIMPLE, LOD_SPRITE = 0, 1, 2  # enemy detail levels
+LOD_NAMES = ('full', 'simple', 'sprite')
+LOD_COUNT_THRESHOLDS = (150, 400)  # on-screen enemies before dropping a level
+LOD_RECOVER_RATIO = 0.8            # share of a threshold to fall under to regain it
+ENEMY_DRAW_BUDGET_MS = 6.0         # enemy layer budget that also drops levels
+QUALITY_TARGET_FPS = 60            # frame rate the quality governor holds
+QUALITY_DOWN_RATIO = 0.9           # share of the frame budget that lowers quality...
+QUALITY_UP_RATIO = 0.5             # ...and the share it must drop under to raise it
+QUALITY_DOWN_FRAMES = 30           # frames over budget before stepping down
+QUALITY_UP_FRAMES = 240            # frames under budget before stepping back up
+ATLAS_BAKE_BUDGET_MS = 2.0         # per-frame time spent baking sprite atlases
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
@@ -25,13 +63,51 @@ SAND = (194, 178, 128)
 ORANGE = (255, 165, 0)
 SKIN = (255, 220, 177)
 
-# Game setup
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Shark Survivors")
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, 36)
-small_font = pygame.font.Font(None, 24)
-tiny_font = pygame.font.Font(None, 18)
+# Game setup (display and fonts are created by init_display, so the
+# simulation can run headless without a window)
+screen = None
+clock = None
+font = None
+small_font = None
+tiny_font = None
+
+def init_display():
+    global screen, clock, font, small_font, tiny_font
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Shark Survivors")
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None, 36)
+    small_font = pygame.font.Font(None, 24)
+    tiny_font = pygame.font.Font(None, 18)
+
+# ============= TEXT =============
+class TextCache:
+    # LRU cache of rendered text surfaces keyed by (font, text, color), so a
+    # string is only rasterized again when its value changes
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+    
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            return surf
+        surf = font.render(text, True, color)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surf
+
+text_cache = TextCache()
+# Debug readouts change every frame; their own small cache keeps them from
+# pushing the HUD's strings out of text_cache
+debug_text_cache = TextCache(max_entries=64)
+
+def render_text(font, text, color):
+    return text_cache.render(font, text, color)
 
 # ============= SLIDER =============
 class Slider:
@@ -79,14 +155,16 @@ class Slider:
         pygame.draw.circle(screen, WHITE, (int(handle_x), self.y), self.handle_radius - 2)
         
         # Label and value
-        label_text = tiny_font.render(self.label, True, WHITE)
+        label_text = render_text(tiny_font, self.label, WHITE)
         screen.blit(label_text, (self.x, self.y - 25))
         
-        value_text = tiny_font.render(f"{self.value:.2f}x", True, YELLOW)
+        value_text = render_text(tiny_font, f"{self.value:.2f}x", YELLOW)
         screen.blit(value_text, (self.x + self.width + 10, self.y - 8))
 
 # ============= UTILS =============
 class Vector2:
+    __slots__ = ('x', 'y')
+    
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -109,31 +187,425 @@ def rotate_point(x, y, cx, cy, angle):
     ry = tx * math.sin(angle) + ty * math.cos(angle)
     return (rx + cx, ry + cy)
 
+class RotatedEllipseCache:
+    # LRU cache of pre-rotated ellipse surfaces keyed by
+    # (color, size, quantized angle, width), capped by approximate pixel memory
+    def __init__(self, angle_steps=72, max_bytes=16 * 1024 * 1024):
+        self.angle_steps = angle_steps
+        self.max_bytes = max_bytes
+        self.surfaces = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def clear(self):
+        self.surfaces.clear()
+        self.bytes_used = 0
+    
+    def get(self, color, size, angle, width=0):
+        step = round(math.degrees(angle) * self.angle_steps / 360) % self.angle_steps
+        key = (color, size, step, width)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surf
+        
+        self.misses += 1
+        shape_surf = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.ellipse(shape_surf, color, (0, 0, *size), width)
+        surf = pygame.transform.rotate(shape_surf, -step * 360 / self.angle_steps)
+        self.surfaces[key] = surf
+        self.bytes_used += surf.get_width() * surf.get_height() * 4
+        while self.bytes_used > self.max_bytes and len(self.surfaces) > 1:
+            _, old = self.surfaces.popitem(last=False)
+            self.bytes_used -= old.get_width() * old.get_height() * 4
+        return surf
+
+ellipse_cache = RotatedEllipseCache()
+
 def draw_rotated_ellipse(surface, color, rect, angle, width=0):
     target_rect = pygame.Rect(rect)
-    shape_surf = pygame.Surface(target_rect.size, pygame.SRCALPHA)
-    pygame.draw.ellipse(shape_surf, color, (0, 0, *target_rect.size), width)
-    rotated_surf = pygame.transform.rotate(shape_surf, -math.degrees(angle))
-    surface.blit(rotated_surf, rotated_surf.get_rect(center=target_rect.center))   
+    rotated_surf = ellipse_cache.get(tuple(color), target_rect.size, angle, width)
+    surface.blit(rotated_surf, rotated_surf.get_rect(center=target_rect.center))
+
+def swap_remove(items, i):
+    # O(1) unordered removal: the last item takes slot i
+    last = items.pop()
+    if i < len(items):
+        items[i] = last
+
+# ============= POOLS =============
+class ObjectPool:
+    # Free list of released objects. acquire() revives one through its
+    # reset() when available (a hit) and only constructs on a miss.
+    # release() calls the object's release() first, so an object waiting on
+    # the free list doesn't keep the objects it refers to alive.
+    def __init__(self, cls, max_free=4096):
+        self.cls = cls
+        self.free = []
+        self.max_free = max_free
+        self.hits = 0
+        self.misses = 0
+    
+    def acquire(self, *args):
+        if self.free:
+            self.hits += 1
+            obj = self.free.pop()
+            obj.reset(*args)
+            return obj
+        self.misses += 1
+        return self.cls(*args)
+    
+    def release(self, obj):
+        if len(self.free) < self.max_free:
+            obj.release()
+            self.free.append(obj)
+    
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+# ============= INPUT =============
+class KeyboardController:
+    def get_direction(self, game):
+        keys = pygame.key.get_pressed()
+        dx = dy = 0
+        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
+            dx -= 1
+        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+            dx += 1
+        if keys[pygame.K_w] or keys[pygame.K_UP]:
+            dy -= 1
+        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
+            dy += 1
+        return dx, dy
+    
+    def choose_level_up(self, game):
+        # Level-up choices come from KEYDOWN events in main()
+        return None
+
+class WanderController:
+    # Scripted input for headless runs: holds a random direction for a while,
+    # then picks a new one, and takes a random level-up option
+    DIRECTIONS = [(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1),
+                  (-1, -1), (-1, 1), (1, -1), (1, 1)]
+    
+    def __init__(self, seed=None, hold_ticks=60):
+        self.rng = random.Random(seed)
+        self.hold_ticks = hold_ticks
+        self.direction = (0, 0)
+        self.ticks_left = 0
+    
+    def get_direction(self, game):
+        if self.ticks_left <= 0:
+            self.direction = self.rng.choice(self.DIRECTIONS)
+            self.ticks_left = self.hold_ticks
+        self.ticks_left -= 1
+        return self.direction
+    
+    def choose_level_up(self, game):
+        return self.rng.randrange(len(game.level_up_options))
+
+# ============= REPLAY =============
+class InputRecorder:
+    # Compact session log: the run seed, per-tick movement as run-length
+    # encoded direction codes, and sparse events (level-up picks and debug
+    # slider values, which also feed the simulation)
+    VERSION = 6
+    
+    def __init__(self, path=None):
+        self.path = path
+        self.start(None)
+    
+    def start(self, seed, vectorized=False):
+        # vectorized is kept because the NumPy and pure-Python enemy paths
+        # round differently, so a replay must allow the same one
+        self.seed = seed
+        self.vectorized = vectorized
+        self.inputs = []
+        self.events = []
+        self.sliders = None
+    
+    def record_tick(self, game, direction):
+        sliders = (game.speed_slider.value, game.damage_slider.value)
+        if sliders != self.sliders:
+            self.sliders = sliders
+            self.record_event(game.time, 'sliders', list(sliders))
+        
+        code = (direction[0] + 1) * 3 + (direction[1] + 1)
+        if self.inputs and self.inputs[-1][0] == code:
+            self.inputs[-1][1] += 1
+        else:
+            self.inputs.append([code, 1])
+    
+    def record_event(self, tick, kind, value):
+        self.events.append([tick, kind, value])
+    
+    def save(self, path=None):
+        data = {
+            'version': self.VERSION,
+            'seed': self.seed,
+            'vectorized': self.vectorized,
+            'inputs': self.inputs,
+            'events': self.events,
+        }
+        with open(path or self.path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+
+class ReplayController:
+    # Feeds a recorded session back into Game: movement per tick, slider
+    # values at the ticks they changed, and level-up picks in order
+    def __init__(self, data):
+        if data.get('version') != InputRecorder.VERSION:
+            raise ValueError(f"Unsupported replay version: {data.get('version')}")
+        self.seed = data['seed']
+        self.vectorized = data.get('vectorized', False)
+        self.inputs = data['inputs']
+        self.total_ticks = sum(count for _, count in self.inputs)
+        self.sliders = {tick: value for tick, kind, value in data['events'] if kind == 'sliders'}
+        self.level_ups = [value for _, kind, value in data['events'] if kind == 'level_up']
+        self.run_index = 0
+        self.run_used = 0
+        self.level_up_index = 0
+    
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+    
+    def get_direction(self, game):
+        sliders = self.sliders.get(game.time)
+        if sliders is not None:
+            game.speed_slider.value, game.damage_slider.value = sliders
+        
+        if self.run_index >= len(self.inputs):
+            return (0, 0)
+        code, count = self.inputs[self.run_index]
+        self.run_used += 1
+        if self.run_used >= count:
+            self.run_index += 1
+            self.run_used = 0
+        return (code // 3 - 1, code % 3 - 1)
+    
+    def choose_level_up(self, game):
+        if self.level_up_index >= len(self.level_ups):
+            return None
+        choice = self.level_ups[self.level_up_index]
+        self.level_up_index += 1
+        return choice
 
 # ============= CAMERA =============
 class Camera:
+    # Rendering only. Moving entities keep the position from the previous
+    # tick in prev_x/prev_y, and frames drawn between ticks blend the two
+    # with alpha.
     def __init__(self):
         self.x = 0
         self.y = 0
+        self.alpha = 1.0
     
     def update(self, target):
         self.x = target.x - WIDTH // 2
         self.y = target.y - HEIGHT // 2
+        self.alpha = 1.0
+    
+    def interpolate(self, target, alpha):
+        self.alpha = alpha
+        self.x = target.prev_x + (target.x - target.prev_x) * alpha - WIDTH // 2
+        self.y = target.prev_y + (target.y - target.prev_y) * alpha - HEIGHT // 2
     
     def apply(self, entity):
-        return (entity.x - self.x, entity.y - self.y)
+        alpha = self.alpha
+        if alpha >= 1.0:
+            return (entity.x - self.x, entity.y - self.y)
+        return (entity.prev_x + (entity.x - entity.prev_x) * alpha - self.x,
+                entity.prev_y + (entity.y - entity.prev_y) * alpha - self.y)
     
     def apply_rect(self, rect):
         return pygame.Rect(rect.x - self.x, rect.y - self.y, rect.width, rect.height)
 
+# ============= SPATIAL HASH =============
+class SpatialHash:
+    # Uniform grid broad phase. Entities are bucketed by their center, so
+    # queries pad the search radius by the largest entity size inserted.
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.max_size = 0
+        self.bounds = None  # (min_cx, min_cy, max_cx, max_cy) of occupied cells
+
+    def clear(self):
+        self.cells.clear()
+        self.max_size = 0
+        self.bounds = None
+
+    def cell_of(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def insert(self, entity):
+        key = (int(entity.x // self.cell_size), int(entity.y // self.cell_size))
+        bucket = self.cells.get(key)
+        if bucket is None:
+            self.cells[key] = [entity]
+            if self.bounds is None:
+                self.bounds = (key[0], key[1], key[0], key[1])
+            else:
+                min_cx, min_cy, max_cx, max_cy = self.bounds
+                if not (min_cx <= key[0] <= max_cx and min_cy <= key[1] <= max_cy):
+                    self.bounds = (min(min_cx, key[0]), min(min_cy, key[1]),
+                                   max(max_cx, key[0]), max(max_cy, key[1]))
+        else:
+            bucket.append(entity)
+        if entity.size > self.max_size:
+            self.max_size = entity.size
+
+    def rebuild(self, entities):
+        self.clear()
+        for entity in entities:
+            self.insert(entity)
+    
+    def rebuild_arrays(self, entities, xs, ys, sizes):
+        # rebuild() from position arrays: entities are grouped by cell with a
+        # sort, keeping their order within each bucket
+        self.clear()
+        if not len(entities):
+            return
+        cx = np.floor_divide(xs, self.cell_size).astype(np.int64)
+        cy = np.floor_divide(ys, self.cell_size).astype(np.int64)
+        order = np.lexsort((cy, cx))
+        cx = cx[order]
+        cy = cy[order]
+        starts = np.flatnonzero(np.r_[True, (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])])
+        ordered = np.empty(len(entities), dtype=object)
+        ordered[:] = entities
+        buckets = np.split(ordered[order], starts[1:])
+        cells = self.cells
+        for key_x, key_y, bucket in zip(cx[starts].tolist(), cy[starts].tolist(), buckets):
+            cells[(key_x, key_y)] = bucket.tolist()
+        self.bounds = (int(cx.min()), int(cy.min()), int(cx.max()), int(cy.max()))
+        self.max_size = int(sizes.max())
+
+    def remove(self, entity):
+        bucket = self.cells.get(self.cell_of(entity.x, entity.y))
+        if bucket is not None and entity in bucket:
+            bucket.remove(entity)
+
+    def query(self, x, y, radius):
+        # Candidates whose center may lie within radius + max_size of (x, y)
+        reach = radius + self.max_size
+        cs = self.cell_size
+        min_cx = int((x - reach) // cs)
+        max_cx = int((x + reach) // cs)
+        min_cy = int((y - reach) // cs)
+        max_cy = int((y + reach) // cs)
+        cells = self.cells
+        found = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    def query_rect(self, left, top, right, bottom):
+        # Entities whose center cell overlaps the rect; callers pad for extent
+        cs = self.cell_size
+        cells = self.cells
+        found = []
+        for cx in range(int(left // cs), int(right // cs) + 1):
+            for cy in range(int(top // cs), int(bottom // cs) + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    def query_many(self, xs, ys, radii):
+        # Bulk query: candidate lists for many circles, with the cell
+        # ranges computed as arrays
+        reach = radii + self.max_size
+        cs = self.cell_size
+        min_cx = np.floor_divide(xs - reach, cs).astype(np.int64).tolist()
+        max_cx = np.floor_divide(xs + reach, cs).astype(np.int64).tolist()
+        min_cy = np.floor_divide(ys - reach, cs).astype(np.int64).tolist()
+        max_cy = np.floor_divide(ys + reach, cs).astype(np.int64).tolist()
+        cells = self.cells
+        results = []
+        for x0, x1, y0, y1 in zip(min_cx, max_cx, min_cy, max_cy):
+            found = []
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    bucket = cells.get((cx, cy))
+                    if bucket:
+                        found.extend(bucket)
+            results.append(found)
+        return results
+
+    def within_radius(self, x, y, radius):
+        # Entities whose center is within radius of (x, y)
+        radius_sq = radius * radius
+        found = []
+        for entity in self.query(x, y, radius - self.max_size):
+            dx = entity.x - x
+            dy = entity.y - y
+            if dx * dx + dy * dy <= radius_sq:
+                found.append(entity)
+        return found
+
+    def k_nearest(self, x, y, k, max_dist=None):
+        # Expanding ring search: visit cells ring by ring around (x, y) and stop
+        # once the k-th best candidate is closer than anything an outer ring holds
+        if not self.cells or k <= 0:
+            return []
+        cs = self.cell_size
+        ox = int(x // cs)
+        oy = int(y // cs)
+        min_cx, min_cy, max_cx, max_cy = self.bounds
+        max_ring = max(ox - min_cx, max_cx - ox, oy - min_cy, max_cy - oy)
+        limit_sq = float('inf')
+        if max_dist is not None:
+            max_ring = min(max_ring, int(max_dist // cs) + 1)
+            limit_sq = max_dist * max_dist
+        
+        cells = self.cells
+        best = []
+        for ring in range(max_ring + 1):
+            if ring == 0:
+                ring_cells = [(ox, oy)]
+            else:
+                ring_cells = [(cx, oy - ring) for cx in range(ox - ring, ox + ring + 1)]
+                ring_cells += [(cx, oy + ring) for cx in range(ox - ring, ox + ring + 1)]
+                ring_cells += [(ox - ring, cy) for cy in range(oy - ring + 1, oy + ring)]
+                ring_cells += [(ox + ring, cy) for cy in range(oy - ring + 1, oy + ring)]
+            for key in ring_cells:
+                bucket = cells.get(key)
+                if not bucket:
+                    continue
+                for entity in bucket:
+                    dx = entity.x - x
+                    dy = entity.y - y
+                    dist_sq = dx * dx + dy * dy
+                    if dist_sq <= limit_sq:
+                        best.append((dist_sq, entity))
+            if len(best) >= k:
+                best.sort(key=lambda item: item[0])
+                del best[k:]
+                # Anything beyond this ring is at least ring * cell_size away
+                reach = ring * cs
+                if best[-1][0] <= reach * reach:
+                    break
+        
+        best.sort(key=lambda item: item[0])
+        return [entity for _, entity in best[:k]]
+
+    def nearest(self, x, y, max_dist=None):
+        found = self.k_nearest(x, y, 1, max_dist)
+        return found[0] if found else None
+
 # ============= OBSTACLES =============
 class Obstacle:
+    __slots__ = ('x', 'y', 'width', 'height', 'type', 'rect', 'sway_phase')
+    
     def __init__(self, x, y, width, height, obstacle_type='coral'):
         self.x = x
         self.y = y
@@ -141,8 +613,11 @@ class Obstacle:
         self.height = height
         self.type = obstacle_type
         self.rect = pygame.Rect(x, y, width, height)
+        # Seeded from the position so it's stable across chunk reloads and
+        # leaves the world RNG streams alone
+        self.sway_phase = random.Random(x * 92821 + y).uniform(0, 2 * math.pi)
     
-    def draw(self, screen, camera):
+    def draw(self, screen, camera, time=0):
         screen_rect = camera.apply_rect(self.rect)
         if self.type == 'coral':
             pygame.draw.ellipse(screen, CORAL_PINK, screen_rect)
@@ -153,9 +628,227 @@ class Obstacle:
         elif self.type == 'seaweed':
             for i in range(3):
                 offset_x = screen_rect.x + i * (screen_rect.width // 3)
+                sway = math.sin(time * 0.05 + self.sway_phase + i) * 5
                 pygame.draw.line(screen, SEAWEED_GREEN, 
                                (offset_x, screen_rect.bottom), 
-                               (offset_x + random.randint(-5, 5), screen_rect.top), 5)
+                               (offset_x + sway, screen_rect.top), 5)
+
+class ObstacleIndex:
+    # Obstacles bucketed by the world chunk their top-left corner falls in.
+    # Lookups only touch the chunks a rect or point can overlap.
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.max_extent = 0
+        self.count = 0
+        self.arrays = {}
+    
+    def __iter__(self):
+        for bucket in self.chunks.values():
+            yield from bucket
+    
+    def __len__(self):
+        return self.count
+    
+    def add(self, obstacle):
+        key = (int(obstacle.x // self.chunk_size), int(obstacle.y // self.chunk_size))
+        self.chunks.setdefault(key, []).append(obstacle)
+        self.max_extent = max(self.max_extent, obstacle.width, obstacle.height)
+        self.count += 1
+        self.arrays.clear()
+    
+    def query_rect(self, left, top, width, height):
+        cs = self.chunk_size
+        right = left + width
+        bottom = top + height
+        found = []
+        for cx in range(int((left - self.max_extent) // cs), int(right // cs) + 1):
+            for cy in range(int((top - self.max_extent) // cs), int(bottom // cs) + 1):
+                bucket = self.chunks.get((cx, cy))
+                if not bucket:
+                    continue
+                for obs in bucket:
+                    if (left < obs.x + obs.width and right > obs.x and
+                        top < obs.y + obs.height and bottom > obs.y):
+                        found.append(obs)
+        return found
+    
+    def cell_index(self, reach, cell_size=OBSTACLE_GRID_CELL_SIZE):
+        # Dense grid over the loaded obstacles for batched tests: each
+        # obstacle, grown by reach px, is listed in every cell it touches.
+        # Returns (origin_x, origin_y, columns, rows, offsets, ids, left,
+        # top, right, bottom); cell c holds ids[offsets[c]:offsets[c + 1]].
+        # Rebuilt after chunks stream in or out.
+        index = self.arrays.get(reach)
+        if index is None:
+            obstacles = list(self)
+            left = np.array([o.x for o in obstacles], dtype=np.float64)
+            top = np.array([o.y for o in obstacles], dtype=np.float64)
+            right = left + np.array([o.width for o in obstacles], dtype=np.float64)
+            bottom = top + np.array([o.height for o in obstacles], dtype=np.float64)
+            if obstacles:
+                origin_x = float((left - reach).min())
+                origin_y = float((top - reach).min())
+                columns = int((right + reach).max() - origin_x) // cell_size + 1
+                rows = int((bottom + reach).max() - origin_y) // cell_size + 1
+            else:
+                origin_x = origin_y = 0.0
+                columns = rows = 0
+            cells = []
+            ids = []
+            for i, o in enumerate(obstacles):
+                x0 = int((o.x - reach - origin_x) // cell_size)
+                x1 = int((o.x + o.width + reach - origin_x) // cell_size)
+                y0 = int((o.y - reach - origin_y) // cell_size)
+                y1 = int((o.y + o.height + reach - origin_y) // cell_size)
+                for gx in range(x0, x1 + 1):
+                    for gy in range(y0, y1 + 1):
+                        cells.append(gx * rows + gy)
+                        ids.append(i)
+            cells = np.array(cells, dtype=np.int64)
+            order = np.argsort(cells, kind='stable')
+            offsets = np.zeros(columns * rows + 1, dtype=np.int64)
+            np.cumsum(np.bincount(cells, minlength=columns * rows), out=offsets[1:])
+            index = self.arrays[reach] = (origin_x, origin_y, columns, rows, offsets,
+                                          np.array(ids, dtype=np.int64)[order],
+                                          left, top, right, bottom)
+        return index
+    
+    def collides_rect(self, left, top, width, height):
+        cs = self.chunk_size
+        right = left + width
+        bottom = top + height
+        for cx in range(int((left - self.max_extent) // cs), int(right // cs) + 1):
+            for cy in range(int((top - self.max_extent) // cs), int(bottom // cs) + 1):
+                bucket = self.chunks.get((cx, cy))
+                if not bucket:
+                    continue
+                for obs in bucket:
+                    if (left < obs.x + obs.width and right > obs.x and
+                        top < obs.y + obs.height and bottom > obs.y):
+                        return True
+        return False
+    
+    def collides_point(self, x, y):
+        cs = self.chunk_size
+        for cx in range(int((x - self.max_extent) // cs), int(x // cs) + 1):
+            for cy in range(int((y - self.max_extent) // cs), int(y // cs) + 1):
+                bucket = self.chunks.get((cx, cy))
+                if not bucket:
+                    continue
+                for obs in bucket:
+                    if obs.rect.collidepoint(x, y):
+                        return True
+        return False
+    
+    def remove_chunk(self, key):
+        bucket = self.chunks.pop(key, None)
+        if bucket:
+            self.count -= len(bucket)
+            self.arrays.clear()
+
+class ObstacleTiles:
+    # Each loaded chunk's obstacles rasterized once into a chunk-sized tile,
+    # so drawing them is a few blits. Tiles are baked the first time their
+    # chunk is on screen and dropped when it (or a neighbour whose
+    # obstacles can overhang it) streams in or out. With sway on, seaweed
+    # stays out of the tiles and is drawn live. Tiles are cached per sway
+    # setting and render scale, so switching back and forth doesn't rebake;
+    # scaled tiles are resized copies of the full-size ones.
+    COLORKEY = (255, 0, 255)
+    
+    def __init__(self, obstacles, chunk_size=CHUNK_SIZE, max_tiles=16, sway=True, scale=1.0):
+        self.obstacles = obstacles
+        self.chunk_size = chunk_size
+        self.max_tiles = max_tiles
+        # (sway, scale) -> (chunk key -> Surface, or None when empty)
+        self.tile_sets = {}
+        self.sway = sway
+        self.scale = scale
+        self.tiles = self.tile_sets.setdefault((sway, scale), OrderedDict())
+        self.offset = Camera()      # maps world coords into a tile
+        self.baked = 0
+    
+    def clear(self):
+        for tiles in self.tile_sets.values():
+            tiles.clear()
+    
+    def set_style(self, sway, scale):
+        self.sway = sway
+        self.scale = scale
+        self.tiles = self.tile_sets.setdefault((sway, scale), OrderedDict())
+    
+    def invalidate(self, key):
+        # Obstacles are bucketed by their top-left corner, so they can only
+        # overhang into the chunks right of and below their own
+        cx, cy = key
+        for tiles in self.tile_sets.values():
+            for tile_key in ((cx, cy), (cx + 1, cy), (cx, cy + 1), (cx + 1, cy + 1)):
+                tiles.pop(tile_key, None)
+    
+    def bake(self, key):
+        if self.scale == 1:
+            return self.rasterize(key)
+        full = self.tile_sets.get((self.sway, 1), {}).get(key, False)
+        if full is False:
+            full = self.rasterize(key)
+        if full is None:
+            return None
+        size = int(self.chunk_size * self.scale)
+        tile = pygame.transform.scale(full, (size, size))
+        tile.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+        return tile
+    
+    def rasterize(self, key):
+        cs = self.chunk_size
+        left = key[0] * cs
+        top = key[1] * cs
+        found = [obs for obs in self.obstacles.query_rect(left, top, cs, cs)
+                 if not (self.sway and obs.type == 'seaweed')]
+        self.baked += 1
+        if not found:
+            return None
+        tile = pygame.Surface((cs, cs))
+        tile.fill(self.COLORKEY)
+        tile.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+        self.offset.x = left
+        self.offset.y = top
+        for obs in found:
+            obs.draw(tile, self.offset)
+        return tile
+    
+    def draw(self, target, camera, view, loaded_chunks):
+        # Into target, which is at the current render scale
+        left, top, right, bottom = view
+        cs = self.chunk_size
+        size = int(cs * self.scale)
+        origin_x = math.ceil(camera.x * self.scale)
+        origin_y = math.ceil(camera.y * self.scale)
+        for cx in range(int(left // cs), int(right // cs) + 1):
+            for cy in range(int(top // cs), int(bottom // cs) + 1):
+                key = (cx, cy)
+                if key not in loaded_chunks:
+                    continue
+                if key in self.tiles:
+                    self.tiles.move_to_end(key)
+                    tile = self.tiles[key]
+                else:
+                    tile = self.tiles[key] = self.bake(key)
+                    while len(self.tiles) > self.max_tiles:
+                        self.tiles.popitem(last=False)
+                if tile is not None:
+                    target.blit(tile, (cx * size - origin_x, cy * size - origin_y))
+    
+    def draw_swaying(self, screen, camera, view, time):
+        # The obstacles drawn live, at full resolution; returns them
+        left, top, right, bottom = view
+        swaying = []
+        if self.sway:
+            for obs in self.obstacles.query_rect(left, top, right - left, bottom - top):
+                if obs.type == 'seaweed':
+                    obs.draw(screen, camera, time)
+                    swaying.append(obs)
+        return swaying
 
 # ============= WEAPONS =============
 class Weapon:
@@ -196,6 +889,8 @@ class Player:
     def __init__(self):
         self.x = 0
         self.y = 0
+        self.prev_x = 0
+        self.prev_y = 0
         self.size = 25
         self.speed = 3.5
         self.max_hp = 100
@@ -208,19 +903,16 @@ class Player:
         self.weapons = [Weapon('harpoon')]
         self.weapon_cooldowns = {}
         
-    def move(self, keys, obstacles, speed_multiplier=1.0):
-        dx = dy = 0
-        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
-            dx -= 1
-        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
-            dx += 1
-        if keys[pygame.K_w] or keys[pygame.K_UP]:
-            dy -= 1
-        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
-            dy += 1
+    def move(self, direction, obstacles, speed_multiplier=1.0):
+        self.prev_x = self.x
+        self.prev_y = self.y
+        dx, dy = direction
         
         if dx != 0 or dy != 0:
-            self.last_move = Vector2(dx, dy).normalize()
+            # Normalized in place; this runs every movement tick
+            length = math.sqrt(dx * dx + dy * dy)
+            self.last_move.x = dx / length
+            self.last_move.y = dy / length
             self.facing_angle = math.atan2(dy, dx)
         
         if dx != 0 and dy != 0:
@@ -236,7 +928,7 @@ class Player:
         can_move_x = True
         can_move_y = True
         
-        for obstacle in obstacles:
+        for obstacle in obstacles.query_rect(*player_rect):
             if player_rect.colliderect(obstacle.rect):
                 test_rect_x = pygame.Rect(new_x - self.size, self.y - self.size, self.size * 2, self.size * 2)
                 if test_rect_x.colliderect(obstacle.rect):
@@ -330,16 +1022,33 @@ class Player:
         pygame.draw.circle(screen, (60, 60, 60), (int(gun_x), int(gun_y)), 4)
 
 # ============= PROJECTILES =============
+# How far each projectile's drawing reaches from its center
+PROJECTILE_DRAW_RADIUS = {'harpoon': 26, 'trident': 38, 'net': 14, 'torpedo': 42}
+
 class Projectile:
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'weapon', 'damage', 'speed', 'size',
+                 'pierce_count', 'hit_enemies', 'store', 'slot', 'vx', 'vy', 'angle',
+                 'draw_radius')
+    
     def __init__(self, x, y, target_x, target_y, weapon, damage_multiplier=1.0):
+        self.hit_enemies = set()
+        self.reset(x, y, target_x, target_y, weapon, damage_multiplier)
+    
+    def reset(self, x, y, target_x, target_y, weapon, damage_multiplier=1.0):
         self.x = x
         self.y = y
+        self.prev_x = x
+        self.prev_y = y
         self.weapon = weapon
         self.damage = weapon.damage * damage_multiplier
         self.speed = weapon.projectile_speed
         self.size = 8
+        self.draw_radius = PROJECTILE_DRAW_RADIUS[weapon.type]
         self.pierce_count = weapon.pierce
-        self.hit_enemies = set()
+        self.hit_enemies.clear()
+        # Set while the projectile lives in a ProjectileStore
+        self.store = None
+        self.slot = -1
         
         dx = target_x - x
         dy = target_y - y
@@ -351,28 +1060,34 @@ class Projectile:
         else:
             self.vx = self.vy = 0
             self.angle = 0
+    
+    def release(self):
+        # Back to the pool: drop the enemies hit, which may be dead by now
+        self.hit_enemies.clear()
 
     def collides_with_obstacle(self, obstacles):
-        hitbox = pygame.Rect(
+        return obstacles.collides_rect(
             self.x - self.size,
             self.y - self.size,
             self.size * 2,
             self.size * 2
         )
-        for obs in obstacles:
-            if hitbox.colliderect(obs.rect):
-                return True
-        return False
     
     def update(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.x += self.vx
         self.y += self.vy
         return self.pierce_count > 0
     
-    def hit(self, enemy_id):
-        if enemy_id not in self.hit_enemies:
-            self.hit_enemies.add(enemy_id)
+    def hit(self, enemy):
+        # Keyed by the enemy itself rather than id(), which can be reused
+        # once an enemy is freed and would make runs irreproducible
+        if enemy not in self.hit_enemies:
+            self.hit_enemies.add(enemy)
             self.pierce_count -= 1
+            if self.store is not None:
+                self.store.pierce[self.slot] = self.pierce_count
             return True
         return False
     
@@ -418,12 +1133,47 @@ class Projectile:
             pygame.draw.circle(screen, RED, (int(end_x), int(end_y)), 6)
 
 # ============= ENEMIES =============
+# (color, layer count, base padding, padding step, base alpha) per halo kind
+GLOW_STYLES = {
+    'elite': (YELLOW, 3, 5, 3, 100),
+    'boss': (RED, 4, 10, 5, 120),
+}
+glow_cache = {}
+
+def get_glow_surface(size, kind):
+    # All halo rings composited once into a single surface per (size, kind)
+    key = (size, kind)
+    glow = glow_cache.get(key)
+    if glow is not None:
+        return glow
+    
+    color, layers, padding, step, alpha = GLOW_STYLES[kind]
+    outer = size + padding + (layers - 1) * step
+    glow = pygame.Surface((outer * 2, outer * 2), pygame.SRCALPHA)
+    for i in range(layers):
+        glow_size = size + padding + i * step
+        layer = pygame.Surface((glow_size * 2, glow_size * 2), pygame.SRCALPHA)
+        pygame.draw.circle(layer, (*color, alpha - i * 30), (glow_size, glow_size), glow_size)
+        glow.blit(layer, (outer - glow_size, outer - glow_size))
+    glow_cache[key] = glow
+    return glow
+
 class Enemy:
-    def __init__(self, x, y, enemy_type='shark', is_elite=False, is_boss=False, difficulty_scale=1.0):
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'type', 'angle', 'store', 'slot', 'spawn_id',
+                 'is_elite', 'is_boss', 'difficulty_scale', 'size', 'speed', 'hp', 'max_hp',
+                 'damage', 'xp_value', 'color', 'float_offset', 'draw_radius')
+    
+    def __init__(self, x, y, enemy_type='shark', is_elite=False, is_boss=False, difficulty_scale=1.0, rng=random):
         self.x = x
         self.y = y
+        self.prev_x = x
+        self.prev_y = y
         self.type = enemy_type
         self.angle = 0
+        # Set while the enemy lives in an EnemyStore
+        self.store = None
+        self.slot = -1
+        self.spawn_id = 0  # order added to the game; breaks contact ties
         self.is_elite = is_elite
         self.is_boss = is_boss
         self.difficulty_scale = difficulty_scale
@@ -444,7 +1194,7 @@ class Enemy:
             self.damage = 15
             self.xp_value = 8
             self.color = (200, 100, 200)
-            self.float_offset = random.uniform(0, math.pi * 2)
+            self.float_offset = rng.uniform(0, math.pi * 2)
         elif enemy_type == 'eel':
             self.size = 15
             self.speed = 3
@@ -528,8 +1278,37 @@ class Enemy:
         # Boss modifiers
         if is_boss:
             self.xp_value = int(self.xp_value * difficulty_scale)
+        
+        # How far draw() reaches from the center, for view culling: the body
+        # plus the HP bar and label above it
+        if self.is_boss:
+            label = self.size + 95
+        elif is_elite:
+            label = self.size + 65
+        else:
+            label = self.size + 26
+        self.draw_radius = max(self.body_radius(), label)
+    
+    def body_radius(self):
+        # How far draw_body() reaches: glow, body and tail, trailing eel
+        # segments, jellyfish tentacles (with the bob), octopus tentacles
+        reach = self.size * 2.5
+        if self.type == 'eel':
+            segments = 7 if self.is_elite else 5
+            reach = max(reach, self.size * (0.8 * (segments - 1) + 1) + 8)
+        elif self.type == 'jellyfish':
+            reach = max(reach, self.size * 1.5 + 40)
+        elif self.type in ('octopus', 'kraken'):
+            reach = max(reach, self.size + 28)
+        if self.is_boss:
+            reach = max(reach, self.size + 25)
+        elif self.is_elite:
+            reach = max(reach, self.size + 11)
+        return reach
     
     def update(self, player, obstacles, time):
+        self.prev_x = self.x
+        self.prev_y = self.y
         if self.type == 'jellyfish':
             self.float_offset += 0.05
             drift_x = math.cos(self.float_offset) * 0.5
@@ -558,28 +1337,37 @@ class Enemy:
     
     def take_damage(self, amount):
         self.hp -= amount
+        if self.store is not None:
+            self.store.hp[self.slot] = self.hp
         return self.hp <= 0
     
-    def draw(self, screen, camera, time):
+    def draw(self, screen, camera, time, lod=LOD_FULL, glow=True, tentacles=1.0):
+        # Bosses always get full detail
+        if lod == LOD_SPRITE and not self.is_boss:
+            self.draw_sprite(screen, camera)
+            return
+        if lod == LOD_SIMPLE and not self.is_boss:
+            self.draw_simple(screen, camera, glow)
+            return
         screen_pos = camera.apply(self)
-        
+        # Drawn procedurally while the kind's atlas is still being baked
+        if not (enemy_atlas.enabled and enemy_atlas.blit(screen, self, screen_pos, time, glow, tentacles)):
+            self.draw_body(screen, screen_pos, time, glow, tentacles)
+        self.draw_hp_bar(screen, screen_pos)
+    
+    def draw_body(self, screen, screen_pos, time, glow=True, tentacles=1.0):
+        # Everything but the HP bar and label; also used to bake the atlas
         # Elite glow effect
-        if self.is_elite:
-            for i in range(3):
-                glow_size = self.size + 5 + i * 3
-                glow_alpha = 100 - i * 30
-                glow_surf = pygame.Surface((glow_size * 2, glow_size * 2), pygame.SRCALPHA)
-                pygame.draw.circle(glow_surf, (*YELLOW, glow_alpha), (glow_size, glow_size), glow_size)
-                screen.blit(glow_surf, (screen_pos[0] - glow_size, screen_pos[1] - glow_size))
+        if self.is_elite and glow:
+            glow_surf = get_glow_surface(self.size, 'elite')
+            glow_size = glow_surf.get_width() // 2
+            screen.blit(glow_surf, (screen_pos[0] - glow_size, screen_pos[1] - glow_size))
         
         # Boss glow effect
-        if self.is_boss:
-            for i in range(4):
-                glow_size = self.size + 10 + i * 5
-                glow_alpha = 120 - i * 30
-                glow_surf = pygame.Surface((glow_size * 2, glow_size * 2), pygame.SRCALPHA)
-                pygame.draw.circle(glow_surf, (*RED, glow_alpha), (glow_size, glow_size), glow_size)
-                screen.blit(glow_surf, (screen_pos[0] - glow_size, screen_pos[1] - glow_size))
+        if self.is_boss and glow:
+            glow_surf = get_glow_surface(self.size, 'boss')
+            glow_size = glow_surf.get_width() // 2
+            screen.blit(glow_surf, (screen_pos[0] - glow_size, screen_pos[1] - glow_size))
         
         # Shark & Megalodon
         body_len = self.size * 2.4
@@ -641,7 +1429,7 @@ class Enemy:
             pygame.draw.circle(screen, self.color, (int(screen_pos[0]), int(body_y)), self.size)
             pygame.draw.circle(screen, (220, 120, 220), (int(screen_pos[0]), int(body_y)), self.size - 3)
             
-            num_tentacles = 8 if self.is_elite else 6
+            num_tentacles = self.tentacle_count(tentacles)
             for i in range(num_tentacles):
                 angle = i * 2 * math.pi / num_tentacles + time * 0.05
                 tentacle_len = self.size + 15 + math.sin(time * 0.1 + i) * 5
@@ -671,7 +1459,7 @@ class Enemy:
                 pygame.draw.circle(screen, YELLOW, (int(screen_pos[0] + eye_offset), int(screen_pos[1] - eye_offset)), 8)
                 pygame.draw.circle(screen, RED, (int(screen_pos[0] + eye_offset), int(screen_pos[1] - eye_offset)), 4)
             
-            num_tentacles = 10 if self.type == 'kraken' else 8
+            num_tentacles = self.tentacle_count(tentacles)
             for i in range(num_tentacles):
                 angle = i * 2 * math.pi / num_tentacles + time * 0.03
                 tentacle_len = self.size + 20
@@ -683,8 +1471,17 @@ class Enemy:
                 thickness = 8 if self.type == 'kraken' else 6
                 pygame.draw.line(screen, self.color, (screen_pos[0], screen_pos[1]), (mid_x, mid_y), thickness)
                 pygame.draw.line(screen, self.color, (mid_x, mid_y), (end_x, end_y), thickness - 2)
-        
-        # HP bar
+    
+    def tentacle_count(self, tentacles=1.0):
+        # tentacles is the share drawn. Counts stay even so the atlas
+        # animation loops in ATLAS_ANIMATION still line up.
+        if self.type == 'jellyfish':
+            full = 8 if self.is_elite else 6
+        else:
+            full = 10 if self.type == 'kraken' else 8
+        return max(4, 2 * int(full * tentacles / 2 + 0.5))
+    
+    def draw_hp_bar(self, screen, screen_pos):
         bar_width = 40 if self.is_boss else (35 if self.is_elite else 30)
         bar_height = 6 if (self.is_boss or self.is_elite) else 4
         hp_ratio = self.hp / self.max_hp
@@ -698,52 +1495,743 @@ class Enemy:
         
         # Elite/Boss label
         if self.is_elite:
-            elite_text = small_font.render("ELITE", True, YELLOW)
+            elite_text = render_text(small_font, "ELITE", YELLOW)
             screen.blit(elite_text, (screen_pos[0] - elite_text.get_width()//2, bar_y - 20))
         elif self.is_boss:
-            boss_text = font.render("BOSS", True, RED)
+            boss_text = render_text(font, "BOSS", RED)
             screen.blit(boss_text, (screen_pos[0] - boss_text.get_width()//2, bar_y - 35))
+    
+    def draw_simple(self, screen, camera, glow=True):
+        # Static silhouette: body plus the type's main shape, no tentacle or
+        # wave animation, and a plain HP bar only once damaged
+        screen_pos = camera.apply(self)
+        if self.is_elite and glow:
+            glow_surf = get_glow_surface(self.size, 'elite')
+            glow_size = glow_surf.get_width() // 2
+            screen.blit(glow_surf, (screen_pos[0] - glow_size, screen_pos[1] - glow_size))
+        
+        body_rect = pygame.Rect(0, 0, self.size * 2.4, self.size * 1.2)
+        body_rect.center = screen_pos
+        draw_rotated_ellipse(screen, self.color, body_rect, self.angle)
+        
+        center = (int(screen_pos[0]), int(screen_pos[1]))
+        if self.type == 'jellyfish':
+            body_y = int(screen_pos[1] + math.sin(self.float_offset) * 5)
+            pygame.draw.circle(screen, (220, 120, 220), (center[0], body_y), self.size)
+        elif self.type == 'eel':
+            for i in range(1, 3):
+                seg_x = screen_pos[0] - i * self.size * 0.8 * math.cos(self.angle)
+                seg_y = screen_pos[1] - i * self.size * 0.8 * math.sin(self.angle)
+                pygame.draw.circle(screen, self.color, (int(seg_x), int(seg_y)), max(3, self.size - i * 2))
+        elif self.type == 'octopus':
+            pygame.draw.circle(screen, (180, 70, 70), center, self.size)
+        
+        if self.hp < self.max_hp:
+            bar_y = screen_pos[1] - self.size - 20
+            pygame.draw.rect(screen, RED, (screen_pos[0] - 15, bar_y, 30, 4))
+            pygame.draw.rect(screen, GREEN, (screen_pos[0] - 15, bar_y, 30 * self.hp / self.max_hp, 4))
+    
+    def draw_sprite(self, screen, camera):
+        # One cached blit per enemy: the rotated body in its color
+        screen_pos = camera.apply(self)
+        size = (int(self.size * 2.4), int(self.size * 1.2))
+        surf = ellipse_cache.get(self.color, size, self.angle)
+        screen.blit(surf, (screen_pos[0] - surf.get_width() // 2, screen_pos[1] - surf.get_height() // 2))
+
+# ============= LOD =============
+class EnemyLOD:
+    # Picks the enemy detail level each frame. The on-screen count sets a
+    # floor; a running per-enemy cost for each level then steps further
+    # down while the estimate would overrun the enemy draw budget. A level
+    # that was dropped only comes back once the count and cost are a margin
+    # under its limits, so a crowd hovering at one doesn't flicker.
+    def __init__(self, budget_ms=ENEMY_DRAW_BUDGET_MS, thresholds=LOD_COUNT_THRESHOLDS):
+        self.budget_ms = budget_ms
+        self.thresholds = thresholds
+        self.cost_ms = [0.02, 0.008, 0.002]  # starting guesses, refined by record()
+        self.level = LOD_FULL
+        self.pinned = None  # fixed level, or None to choose automatically
+        self.floor = LOD_FULL  # most detail allowed, set by the quality governor
+    
+    def choose(self, count):
+        if self.pinned is not None:
+            self.level = self.pinned
+            return self.level
+        level = self.floor
+        while level < LOD_SPRITE and self.over_limit(level, count):
+            level += 1
+        self.level = level
+        return level
+    
+    def over_limit(self, level, count):
+        margin = LOD_RECOVER_RATIO if self.level > level else 1.0
+        return (count > self.thresholds[level] * margin or
+                count * self.cost_ms[level] > self.budget_ms * margin)
+    
+    def cycle_pin(self):
+        # auto -> full -> simple -> sprite -> auto
+        if self.pinned is None:
+            self.pinned = LOD_FULL
+        elif self.pinned < LOD_SPRITE:
+            self.pinned += 1
+        else:
+            self.pinned = None
+    
+    def record(self, level, count, elapsed_ms):
+        # Small counts are dominated by fixed overhead, so they don't update the cost
+        if count >= 20:
+            self.cost_ms[level] += (elapsed_ms / count - self.cost_ms[level]) * 0.1
+
+# ============= QUALITY =============
+# Render settings from most to least detailed: glow halos, share of
+# tentacles drawn, background bubbles, gem bob, seaweed sway, the most
+# detailed enemy LOD allowed and the backdrop's render scale. Glow and
+# tentacles apply to atlas sprites too, through per-setting atlas variants.
+# Below scale 1 the background and obstacle tiles, which cover the window,
+# render into a smaller off-screen target that is scaled up under the
+# sprites; sprites and live seaweed stay at full resolution.
+QUALITY_LEVELS = (
+    ('high', {'glow': True, 'tentacles': 1.0, 'bubbles': 20, 'gem_float': True, 'sway': True,
+              'lod_floor': LOD_FULL, 'scale': 1.0}),
+    ('medium', {'glow': True, 'tentacles': 0.75, 'bubbles': 12, 'gem_float': True, 'sway': True,
+                'lod_floor': LOD_FULL, 'scale': 1.0}),
+    ('low', {'glow': False, 'tentacles': 0.5, 'bubbles': 6, 'gem_float': False, 'sway': True,
+             'lod_floor': LOD_SIMPLE, 'scale': 0.5}),
+    ('minimal', {'glow': False, 'tentacles': 0.5, 'bubbles': 0, 'gem_float': False, 'sway': False,
+                 'lod_floor': LOD_SIMPLE, 'scale': 0.5}),
+)
+QUALITY_NAMES = tuple(name for name, _ in QUALITY_LEVELS)
+
+class QualityGovernor:
+    # Steps the quality level against a smoothed frame time. Stepping down
+    # and back up use separate thresholds and hold times, so a frame time
+    # near the budget doesn't flip between levels.
+    def __init__(self, target_fps=QUALITY_TARGET_FPS):
+        self.budget_ms = 1000 / target_fps
+        self.pinned = None  # fixed level, or None to follow the frame time
+        self.frame_ms = 0.0
+        self.over = 0
+        self.under = 0
+        self.set_level(0)
+    
+    def set_level(self, level):
+        self.level = level
+        self.name, self.settings = QUALITY_LEVELS[level]
+        self.over = self.under = 0
+    
+    def pin(self, level):
+        self.pinned = level
+        if level is not None:
+            self.set_level(level)
+    
+    def cycle_pin(self):
+        # auto -> high -> ... -> minimal -> auto
+        if self.pinned is None:
+            self.pin(0)
+        elif self.pinned + 1 < len(QUALITY_LEVELS):
+            self.pin(self.pinned + 1)
+        else:
+            self.pin(None)
+    
+    def record(self, elapsed_ms):
+        self.frame_ms += (elapsed_ms - self.frame_ms) * 0.1
+        if self.pinned is not None:
+            return
+        if self.frame_ms > self.budget_ms * QUALITY_DOWN_RATIO:
+            self.over += 1
+            self.under = 0
+            if self.over >= QUALITY_DOWN_FRAMES and self.level + 1 < len(QUALITY_LEVELS):
+                self.set_level(self.level + 1)
+        elif self.frame_ms < self.budget_ms * QUALITY_UP_RATIO:
+            self.under += 1
+            self.over = 0
+            if self.under >= QUALITY_UP_FRAMES and self.level > 0:
+                self.set_level(self.level - 1)
+        else:
+            self.over = self.under = 0
+
+# ============= SPRITE ATLAS =============
+ATLAS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "shark_survivors", "sprites")
+ATLAS_SHEET_WIDTH = 2048
+# Animated types: (phases, ticks per loop). Loops follow the tentacle and
+# wave periods in draw_body; octopi loop on their rotational symmetry, so
+# theirs is the turn per tentacle and gets divided by the tentacle count.
+ATLAS_ANIMATION = {
+    'jellyfish': (8, 2 * math.pi / 0.1),
+    'eel': (8, 2 * math.pi / 0.1),
+    'octopus': (4, 2 * math.pi / 0.03),
+    'kraken': (4, 2 * math.pi / 0.03),
+}
+TENTACLED_TYPES = ('jellyfish', 'octopus', 'kraken')
+
+class EnemySpriteAtlas:
+    # Pre-rendered draw_body() frames per (type, elite, boss, size, color,
+    # glow, tentacles), over rotation x animation phase. A kind's atlases
+    # for every quality level are queued the first time it is drawn, baked
+    # a few frames at a time by work() and packed into one sheet each.
+    # With a cache_dir, sheets are also kept on disk under a fingerprint of
+    # the drawing code, so edits never load stale sprites.
+    def __init__(self, cache_dir=None, angle_steps=32, animated_angle_steps=16):
+        self.cache_dir = cache_dir
+        self.angle_steps = angle_steps
+        self.animated_angle_steps = animated_angle_steps
+        self.enabled = True
+        self.atlases = {}
+        self.pending = OrderedDict()  # key -> bake in progress
+        self.baked = 0
+        self.loaded = 0
+        self.fingerprint = None
+    
+    def clear(self):
+        self.atlases.clear()
+        self.pending.clear()
+    
+    def layout(self, enemy, tentacles=1.0):
+        phases, period = ATLAS_ANIMATION.get(enemy.type, (1, 1.0))
+        if enemy.type in ('octopus', 'kraken'):
+            period /= enemy.tentacle_count(tentacles)
+        steps = self.animated_angle_steps if phases > 1 else self.angle_steps
+        return steps, phases, period
+    
+    def path(self, key):
+        enemy_type, is_elite, is_boss, size, color, glow, tentacles = key
+        name = (f"{enemy_type}_{int(is_elite)}{int(is_boss)}_{size}_{'%02x%02x%02x' % color}"
+                f"_g{int(glow)}_t{int(tentacles * 100)}")
+        if self.fingerprint is None:
+            self.fingerprint = self.drawing_fingerprint()
+        return os.path.join(self.cache_dir, self.fingerprint, name)
+    
+    def drawing_fingerprint(self):
+        # Hash of the bytecode and settings that produce the frames
+        digest = hashlib.sha1()
+        for func in (Enemy.__init__, Enemy.draw_body, Enemy.tentacle_count, Enemy.body_radius,
+                     get_glow_surface, draw_rotated_ellipse, RotatedEllipseCache.get):
+            digest.update(marshal.dumps(func.__code__))
+        digest.update(repr((GLOW_STYLES, ATLAS_ANIMATION, self.angle_steps,
+                            self.animated_angle_steps, pygame.version.ver)).encode())
+        return digest.hexdigest()[:16]
+    
+    def key(self, enemy, glow=True, tentacles=1.0):
+        # Settings that don't change an enemy's look share the full atlas
+        if not (enemy.is_elite or enemy.is_boss):
+            glow = True
+        if enemy.type not in TENTACLED_TYPES:
+            tentacles = 1.0
+        return (enemy.type, enemy.is_elite, enemy.is_boss, enemy.size, enemy.color, glow, tentacles)
+    
+    def variants(self, enemy):
+        # Keys of the enemy kind's atlases at each quality level
+        keys = []
+        for _, settings in QUALITY_LEVELS:
+            key = self.key(enemy, settings['glow'], settings['tentacles'])
+            if key not in keys:
+                keys.append(key)
+        return keys
+    
+    def get(self, enemy, glow=True, tentacles=1.0):
+        # The atlas for these settings. While that one is queued or being
+        # baked, a ready variant of the same kind stands in, else None.
+        key = self.key(enemy, glow, tentacles)
+        atlas = self.atlases.get(key)
+        if atlas is not None:
+            return atlas
+        variants = self.variants(enemy)
+        if key not in self.pending:
+            # The first request for a kind queues it at every quality level,
+            # so a later quality change never waits on a bake
+            for variant in [key] + variants:
+                if variant in self.atlases or variant in self.pending:
+                    continue
+                atlas = self.load(variant, enemy)
+                if atlas is None:
+                    self.pending[variant] = self.bake(variant, enemy)
+                else:
+                    self.atlases[variant] = atlas
+            atlas = self.atlases.get(key)
+            if atlas is not None:
+                return atlas
+        # The atlas needed now is baked next
+        self.pending.move_to_end(key, last=False)
+        for variant in variants:
+            atlas = self.atlases.get(variant)
+            if atlas is not None:
+                return atlas
+        return None
+    
+    def work(self, budget_ms=ATLAS_BAKE_BUDGET_MS):
+        # Advances the queued bakes, one frame at a time, for about budget_ms
+        deadline = time.perf_counter() + budget_ms / 1000
+        while self.pending:
+            key, job = next(iter(self.pending.items()))
+            try:
+                next(job)
+            except StopIteration as done:
+                del self.pending[key]
+                self.atlases[key] = done.value
+            if time.perf_counter() >= deadline:
+                break
+    
+    def blit(self, screen, enemy, screen_pos, time, glow=True, tentacles=1.0):
+        # False when there is no atlas to draw from yet
+        atlas = self.get(enemy, glow, tentacles)
+        if atlas is None:
+            return False
+        steps, phases, frames, period = atlas
+        step = round(enemy.angle * steps / (2 * math.pi)) % steps
+        phase = int(time * phases / period) % phases if phases > 1 else 0
+        surf, ox, oy = frames[phase * steps + step]
+        y = screen_pos[1] + oy
+        if enemy.type == 'jellyfish':
+            y += math.sin(enemy.float_offset) * 5
+        screen.blit(surf, (screen_pos[0] + ox, y))
+        return True
+    
+    def bake(self, key, enemy):
+        # Generator for work(): yields after each frame drawn and returns
+        # the atlas
+        glow, tentacles = key[5:]
+        steps, phases, period = self.layout(enemy, tentacles)
+        # Template with the same look, drawn at rest; the bob is applied per blit
+        model = Enemy(0, 0, enemy.type, enemy.is_elite, enemy.is_boss, rng=random.Random(0))
+        model.size = enemy.size
+        model.color = enemy.color
+        if enemy.type == 'jellyfish':
+            model.float_offset = 0.0
+        half = int(math.ceil(model.body_radius())) + 4
+        canvas = pygame.Surface((half * 2, half * 2), pygame.SRCALPHA)
+        
+        crops = []
+        for phase in range(phases):
+            time = phase * period / phases
+            for step in range(steps):
+                model.angle = step * 2 * math.pi / steps
+                canvas.fill((0, 0, 0, 0))
+                model.draw_body(canvas, (half, half), time, glow, tentacles)
+                rect = canvas.get_bounding_rect()
+                crops.append((canvas.subsurface(rect).copy(), rect.x - half, rect.y - half))
+                yield
+        
+        # Shelf-pack the cropped frames into one sheet, tallest first
+        placements = [None] * len(crops)
+        x = y = shelf = 0
+        for i in sorted(range(len(crops)), key=lambda i: -crops[i][0].get_height()):
+            w, h = crops[i][0].get_size()
+            if x + w > ATLAS_SHEET_WIDTH:
+                x = 0
+                y += shelf
+                shelf = 0
+            placements[i] = (x, y, w, h)
+            x += w
+            shelf = max(shelf, h)
+        sheet = pygame.Surface((ATLAS_SHEET_WIDTH, max(1, y + shelf)), pygame.SRCALPHA)
+        for (surf, _, _), (px, py, _, _) in zip(crops, placements):
+            sheet.blit(surf, (px, py))
+            yield
+        index = [(px, py, w, h, ox, oy) for (px, py, w, h), (_, ox, oy) in zip(placements, crops)]
+        self.save(key, sheet, index)
+        self.baked += 1
+        return self.slice(sheet, index, steps, phases, period)
+    
+    def slice(self, sheet, index, steps, phases, period):
+        if pygame.display.get_surface() is not None:
+            sheet = sheet.convert_alpha()
+        frames = [(sheet.subsurface((px, py, w, h)), ox, oy) for px, py, w, h, ox, oy in index]
+        return steps, phases, frames, period
+    
+    def save(self, key, sheet, index):
+        # The cache is only a speed-up, so failures to write it are ignored
+        if self.cache_dir is None:
+            return
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pygame.image.save(sheet, path + ".png")
+            with open(path + ".json", "w") as f:
+                json.dump(index, f)
+        except (OSError, pygame.error):
+            pass
+    
+    def load(self, key, enemy):
+        if self.cache_dir is None:
+            return None
+        steps, phases, period = self.layout(enemy, key[6])
+        path = self.path(key)
+        try:
+            with open(path + ".json") as f:
+                index = json.load(f)
+            sheet = pygame.image.load(path + ".png")
+        except (OSError, ValueError, pygame.error):
+            return None
+        if len(index) != steps * phases:
+            return None
+        self.loaded += 1
+        return self.slice(sheet, index, steps, phases, period)
+
+enemy_atlas = EnemySpriteAtlas()
+
+# ============= ARRAY STORES =============
+class ArrayAttribute:
+    # Item attribute kept in its ArrayStore's arrays rather than on the object
+    __slots__ = ('field',)
+    
+    def __init__(self, field):
+        self.field = field
+    
+    def __get__(self, item, owner=None):
+        if item is None:
+            return self
+        return getattr(item.store, self.field).item(item.slot)
+    
+    def __set__(self, item, value):
+        getattr(item.store, self.field)[item.slot] = value
+
+class ArrayStore:
+    # Struct-of-arrays mirror of live entities for NumPy batch updates.
+    # items[i] is the object for array slot i; removal swaps the last slot in.
+    # Objects stay the interface for drawing and collision, so batch steps
+    # copy positions back to them. Subclasses list their FIELDS and define
+    # write(i, item) to fill slot i from an object.
+    # A store with a LIVE_CLASS instead switches items to that subclass
+    # while stored; its ArrayAttributes for LIVE_FIELDS read the arrays, so
+    # those need no copying back. Removal hands the values back.
+    FIELDS = ()
+    INT_FIELDS = ()
+    LIVE_FIELDS = ()
+    LIVE_CLASS = None
+    
+    def __init__(self, capacity=256):
+        self.items = []
+        self.n = 0
+        self.capacity = capacity
+        self.pool = None  # removed items are released here when set
+        for field in self.FIELDS:
+            dtype = np.int32 if field in self.INT_FIELDS else np.float64
+            setattr(self, field, np.zeros(capacity, dtype=dtype))
+    
+    def __len__(self):
+        return self.n
+    
+    def grow(self):
+        self.capacity *= 2
+        for field in self.FIELDS:
+            old = getattr(self, field)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, field, new)
+    
+    def add(self, item):
+        if self.n == self.capacity:
+            self.grow()
+        self.write(self.n, item)
+        item.store = self
+        item.slot = self.n
+        if self.LIVE_CLASS is not None:
+            item.__class__ = self.LIVE_CLASS
+        self.items.append(item)
+        self.n += 1
+    
+    def remove(self, item):
+        i = item.slot
+        if self.LIVE_CLASS is not None:
+            values = [getattr(self, field).item(i) for field in self.LIVE_FIELDS]
+            item.__class__ = self.LIVE_CLASS.__base__
+            for field, value in zip(self.LIVE_FIELDS, values):
+                setattr(item, field, value)
+        last = self.n - 1
+        if i != last:
+            for field in self.FIELDS:
+                array = getattr(self, field)
+                array[i] = array[last]
+            moved = self.items[last]
+            self.items[i] = moved
+            moved.slot = i
+        self.items.pop()
+        self.n -= 1
+        item.store = None
+        item.slot = -1
+        if self.pool is not None:
+            self.pool.release(item)
+    
+    def remove_slots(self, slots):
+        # Highest slot first, so the slot swapped in is never one still to remove
+        for i in sorted(slots, reverse=True):
+            self.remove(self.items[i])
+    
+    def in_view(self, left, top, right, bottom):
+        # Items whose draw bounds overlap the rect, in slot order
+        n = self.n
+        x = self.x[:n]
+        y = self.y[:n]
+        radius = self.draw_radius[:n]
+        inside = ((x + radius > left) & (x - radius < right) &
+                  (y + radius > top) & (y - radius < bottom))
+        items = self.items
+        return [items[i] for i in np.flatnonzero(inside).tolist()]
+
+ENEMY_TYPE_IDS = {name: i for i, name in enumerate(
+    ['shark', 'jellyfish', 'eel', 'octopus', 'megalodon', 'kraken', 'piranha', 'hammerhead', 'crab'])}
+
+class StoredEnemy(Enemy):
+    # An Enemy while it lives in an EnemyStore
+    __slots__ = ()
+    x = ArrayAttribute('x')
+    y = ArrayAttribute('y')
+    prev_x = ArrayAttribute('prev_x')
+    prev_y = ArrayAttribute('prev_y')
+    angle = ArrayAttribute('angle')
+    float_offset = ArrayAttribute('float_offset')
+
+class EnemyStore(ArrayStore):
+    # Chase movement, drift, culling and contact tests run as array ops.
+    # Positions, angles and drift phases live only in the arrays.
+    FIELDS = ('x', 'y', 'prev_x', 'prev_y', 'speed', 'hp', 'size', 'angle', 'type_id',
+              'float_offset', 'damage', 'draw_radius', 'spawn_id')
+    INT_FIELDS = ('type_id', 'spawn_id')
+    LIVE_FIELDS = ('x', 'y', 'prev_x', 'prev_y', 'angle', 'float_offset')
+    LIVE_CLASS = StoredEnemy
+    
+    def __init__(self, capacity=256):
+        super().__init__(capacity)
+        self.enemies = self.items
+    
+    def write(self, i, enemy):
+        self.x[i] = enemy.x
+        self.y[i] = enemy.y
+        self.prev_x[i] = enemy.prev_x
+        self.prev_y[i] = enemy.prev_y
+        self.speed[i] = enemy.speed
+        self.hp[i] = enemy.hp
+        self.size[i] = enemy.size
+        self.angle[i] = enemy.angle
+        self.type_id[i] = ENEMY_TYPE_IDS[enemy.type]
+        self.float_offset[i] = getattr(enemy, 'float_offset', 0.0)
+        self.damage[i] = enemy.damage
+        self.draw_radius[i] = enemy.draw_radius
+        self.spawn_id[i] = enemy.spawn_id
+    
+    def update(self, player):
+        n = self.n
+        if n == 0:
+            return
+        x = self.x[:n]
+        y = self.y[:n]
+        self.prev_x[:n] = x
+        self.prev_y[:n] = y
+        angle = self.angle[:n]
+        type_id = self.type_id[:n]
+        
+        jelly = type_id == ENEMY_TYPE_IDS['jellyfish']
+        float_offset = self.float_offset[:n]
+        float_offset[jelly] += 0.05
+        drift_x = np.where(jelly, np.cos(float_offset) * 0.5, 0.0)
+        drift_y = np.where(jelly, np.sin(float_offset * 0.7) * 0.5, 0.0)
+        
+        dx = player.x - x
+        dy = player.y - y
+        dist = np.sqrt(dx * dx + dy * dy)
+        moving = dist > 0
+        safe_dist = np.where(moving, dist, 1.0)
+        
+        move_speed = self.speed[:n] * np.where(
+            (type_id == ENEMY_TYPE_IDS['eel']) & (dist < 300), 1.5, 1.0)
+        angle[:] = np.where(moving, np.arctan2(dy, dx), angle)
+        x += np.where(moving, dx / safe_dist * move_speed + drift_x, 0.0)
+        y += np.where(moving, dy / safe_dist * move_speed + drift_y, 0.0)
+    
+    def cull(self, px, py, distance):
+        n = self.n
+        far = (np.abs(self.x[:n] - px) >= distance) | (np.abs(self.y[:n] - py) >= distance)
+        self.remove_slots(np.flatnonzero(far).tolist())
+    
+    def remove_dead(self):
+        self.remove_slots(np.flatnonzero(self.hp[:self.n] <= 0).tolist())
+    
+    def first_contact(self, px, py, radius):
+        # Earliest spawned enemy overlapping a circle at (px, py)
+        n = self.n
+        if n == 0:
+            return None
+        dx = self.x[:n] - px
+        dy = self.y[:n] - py
+        reach = self.size[:n] + radius
+        touching = np.flatnonzero(dx * dx + dy * dy < reach * reach)
+        if not len(touching):
+            return None
+        return self.enemies[touching[np.argmin(self.spawn_id[touching])]]
+
+WEAPON_TYPE_IDS = {name: i for i, name in enumerate(['harpoon', 'trident', 'net', 'torpedo'])}
+
+class ProjectileStore(ArrayStore):
+    # Integration, range culling, obstacle hits and pierce filtering run as
+    # one batched step per tick
+    FIELDS = ('x', 'y', 'vx', 'vy', 'damage', 'pierce', 'size', 'hit_radius', 'weapon_id',
+              'draw_radius')
+    INT_FIELDS = ('pierce', 'weapon_id')
+    
+    def __init__(self, capacity=256):
+        super().__init__(capacity)
+        self.projectiles = self.items
+    
+    def write(self, i, proj):
+        self.x[i] = proj.x
+        self.y[i] = proj.y
+        self.vx[i] = proj.vx
+        self.vy[i] = proj.vy
+        self.damage[i] = proj.damage
+        self.pierce[i] = proj.pierce_count
+        self.size[i] = proj.size
+        # Broad-phase radius: the net's area of effect, else the projectile size
+        self.hit_radius[i] = getattr(proj.weapon, 'aoe_radius', proj.size)
+        self.weapon_id[i] = WEAPON_TYPE_IDS[proj.weapon.type]
+        self.draw_radius[i] = proj.draw_radius
+    
+    def step(self, player, obstacles, max_range):
+        n = self.n
+        if n == 0:
+            return
+        x = self.x[:n]
+        y = self.y[:n]
+        x += self.vx[:n]
+        y += self.vy[:n]
+        
+        dead = self.pierce[:n] <= 0
+        dead |= (np.abs(x - player.x) > max_range) | (np.abs(y - player.y) > max_range)
+        
+        # Obstacle hits: each projectile against the obstacles listed in
+        # its grid cell only
+        if len(obstacles):
+            size = self.size[:n]
+            cell_size = OBSTACLE_GRID_CELL_SIZE
+            (origin_x, origin_y, columns, rows, offsets, ids,
+             left, top, right, bottom) = obstacles.cell_index(float(size.max()))
+            gx = np.floor_divide(x - origin_x, cell_size).astype(np.int64)
+            gy = np.floor_divide(y - origin_y, cell_size).astype(np.int64)
+            inside = np.flatnonzero((gx >= 0) & (gx < columns) & (gy >= 0) & (gy < rows))
+            cells = gx[inside] * rows + gy[inside]
+            first = offsets[cells]
+            counts = offsets[cells + 1] - first
+            total = int(counts.sum())
+            if total:
+                # One (projectile, obstacle) pair per candidate
+                pair_proj = np.repeat(inside, counts)
+                pair_start = np.repeat(first - (np.cumsum(counts) - counts), counts)
+                pair_obs = ids[pair_start + np.arange(total)]
+                px = x[pair_proj]
+                py = y[pair_proj]
+                ps = size[pair_proj]
+                hit = ((px - ps < right[pair_obs]) & (px + ps > left[pair_obs]) &
+                       (py - ps < bottom[pair_obs]) & (py + ps > top[pair_obs]))
+                dead[pair_proj[hit]] = True
+        
+        for proj, px, py in zip(self.projectiles, x.tolist(), y.tolist()):
+            proj.prev_x = proj.x
+            proj.prev_y = proj.y
+            proj.x = px
+            proj.y = py
+        self.remove_slots(np.flatnonzero(dead).tolist())
+    
+    def remove_spent(self):
+        self.remove_slots(np.flatnonzero(self.pierce[:self.n] <= 0).tolist())
+
+class GemStore(ArrayStore):
+    # Magnetism and pickup tests as one pass; only gems inside their
+    # collection radius are touched from Python
+    FIELDS = ('x', 'y', 'radius', 'size', 'draw_radius')
+    
+    def __init__(self, capacity=256):
+        super().__init__(capacity)
+        self.gems = self.items
+        self.moving = []
+    
+    def write(self, i, gem):
+        self.x[i] = gem.x
+        self.y[i] = gem.y
+        self.radius[i] = gem.collection_radius
+        self.size[i] = gem.size
+        self.draw_radius[i] = gem.draw_radius
+    
+    def step(self, player, speed, cull_distance):
+        # Moves attracted gems; returns slots of collected and out-of-range gems
+        for gem in self.moving:
+            gem.prev_x = gem.x
+            gem.prev_y = gem.y
+        self.moving = []
+        n = self.n
+        if n == 0:
+            return [], []
+        x = self.x[:n]
+        y = self.y[:n]
+        dx = player.x - x
+        dy = player.y - y
+        dist_sq = dx * dx + dy * dy
+        reach = player.size + self.size[:n]
+        collected = np.flatnonzero(dist_sq < reach * reach).tolist()
+        far = np.flatnonzero((np.abs(dx) >= cull_distance) | (np.abs(dy) >= cull_distance)).tolist()
+        
+        near = np.flatnonzero((dist_sq < self.radius[:n] ** 2) & (dist_sq > 0))
+        if len(near):
+            dist = np.sqrt(dist_sq[near])
+            x[near] += dx[near] / dist * speed
+            y[near] += dy[near] / dist * speed
+            gems = self.gems
+            for i, gx, gy in zip(near.tolist(), x[near].tolist(), y[near].tolist()):
+                gem = gems[i]
+                gem.prev_x = gem.x
+                gem.prev_y = gem.y
+                gem.x = gx
+                gem.y = gy
+                self.moving.append(gem)
+        
+        return collected, far
 
 # ============= XP GEM =============
 class XPGem:
-    def __init__(self, x, y, value=5):
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'value', 'size', 'collection_radius',
+                 'float_offset', 'store', 'slot', 'draw_radius')
+    
+    def __init__(self, x, y, value=5, rng=random):
+        self.reset(x, y, value, rng)
+    
+    def reset(self, x, y, value=5, rng=random):
         self.x = x
         self.y = y
+        self.prev_x = x
+        self.prev_y = y
         self.value = value
         self.size = 8
+        self.draw_radius = self.size + 5  # plus the bob
         self.collection_radius = 150
-        self.float_offset = random.uniform(0, math.pi * 2)
+        self.float_offset = rng.uniform(0, math.pi * 2)
+        # Set while the gem lives in a GemStore
+        self.store = None
+        self.slot = -1
     
-    def update(self, player, time):
-        self.float_offset += 0.1
-        
-        dx = player.x - self.x
-        dy = player.y - self.y
-        dist = math.sqrt(dx**2 + dy**2)
-        
-        if dist < self.collection_radius:
-            if dist > 0:
-                speed = 10
-                self.x += (dx / dist) * speed
-                self.y += (dy / dist) * speed
-        
-        if dist < player.size + self.size:
-            return True
-        return False
+    def release(self):
+        # Back to the pool; a gem holds nothing worth dropping
+        pass
     
-    def draw(self, screen, camera, time):
+    def draw(self, screen, camera, time, bob=True):
+        # Bob phase is derived from the game clock so idle gems need no update
         screen_pos = camera.apply(self)
-        float_y = screen_pos[1] + math.sin(self.float_offset) * 5
+        float_y = screen_pos[1]
+        if bob:
+            float_y += math.sin(self.float_offset + time * 0.1) * 5
         pygame.draw.circle(screen, (240, 230, 220), (int(screen_pos[0]), int(float_y)), self.size)
         pygame.draw.circle(screen, WHITE, (int(screen_pos[0]), int(float_y)), self.size - 2)
 
 # ============= Chest =============
 
 class Chest:
-    def __init__(self, x, y):
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'chunk_key', 'size', 'opened', 'draw_radius')
+
+    def __init__(self, x, y, chunk_key=None):
         self.x = x
         self.y = y
+        self.prev_x = x
+        self.prev_y = y
+        self.chunk_key = chunk_key
         self.size = 22
+        self.draw_radius = 20
         self.opened = False
 
     def update(self, player):
@@ -766,10 +2254,16 @@ class Chest:
 # ============= Shrine =============
 
 class Shrine:
-    def __init__(self, x, y):
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'chunk_key', 'size', 'used', 'draw_radius')
+
+    def __init__(self, x, y, chunk_key=None):
         self.x = x
         self.y = y
+        self.prev_x = x
+        self.prev_y = y
+        self.chunk_key = chunk_key
         self.size = 28
+        self.draw_radius = self.size
         self.used = False
 
     def update(self, player):
@@ -790,20 +2284,257 @@ class Shrine:
         pygame.draw.circle(screen, (255,255,255), pos, 6)
 
 def point_in_obstacle(x, y, obstacles):
-    for obs in obstacles:
-        if obs.rect.collidepoint(x, y):
-            return True
-    return False
+    return obstacles.collides_point(x, y)
+
+# ============= BACKGROUND =============
+class Background:
+    # The gradient and a bubble layer per bubble count are baked once for
+    # each render target size; Game bakes every quality level's up front, so
+    # a quality change never rebakes. Each frame is a gradient blit plus one
+    # blit of the bubble layer at its parallax offset. Targets smaller than
+    # the window get the same picture, scaled down.
+    BUBBLE_KEY = (255, 0, 255)
+    
+    def __init__(self, bubble_count=20):
+        self.bubble_count = bubble_count
+        self.gradients = {}  # size -> Surface
+        self.layers = {}     # (size, bubble count) -> bubble layer
+        self.size = None     # size last drawn at
+        self.offset = (0, 0)
+    
+    def bake(self, surface, bubble_count):
+        size = width, height = surface.get_size()
+        if size not in self.gradients:
+            gradient = pygame.Surface(size)
+            for y in range(0, height, 2):
+                color_ratio = y / height
+                r = int(OCEAN_BLUE[0] + (DARK_BLUE[0] - OCEAN_BLUE[0]) * color_ratio)
+                g = int(OCEAN_BLUE[1] + (DARK_BLUE[1] - OCEAN_BLUE[1]) * color_ratio)
+                b = int(OCEAN_BLUE[2] + (DARK_BLUE[2] - OCEAN_BLUE[2]) * color_ratio)
+                pygame.draw.line(gradient, (r, g, b), (0, y), (width, y), 2)
+            if pygame.display.get_surface() is not None:
+                gradient = gradient.convert()
+            self.gradients[size] = gradient
+        if bubble_count and (size, bubble_count) not in self.layers:
+            layer = self.bake_bubbles(size, bubble_count)
+            # The RLE encoding is done against the target on a layer's
+            # first blit, so that happens here rather than mid-game
+            surface.blit(layer, (0, 0))
+            self.layers[(size, bubble_count)] = layer
+    
+    def bake_bubbles(self, size, bubble_count):
+        # The bubble pattern wraps in both directions. It is baked 2x2 so any
+        # screen-sized window into it, at any offset, is a single blit.
+        width, height = size
+        scale = width / WIDTH
+        radius = max(1, round(3 * scale))
+        layer = pygame.Surface((width * 2, height * 2))
+        layer.fill(self.BUBBLE_KEY)
+        layer.set_colorkey(self.BUBBLE_KEY, pygame.RLEACCEL)
+        for i in range(bubble_count):
+            bx, by = self.bubble_position(i, scale)
+            for wx in (-width, 0, width, width * 2):
+                for wy in (-height, 0, height, height * 2):
+                    pygame.draw.circle(layer, (50, 80, 140), (bx + wx, by + wy), radius)
+        if pygame.display.get_surface() is not None:
+            layer = layer.convert()
+        return layer
+    
+    @staticmethod
+    def bubble_position(i, scale):
+        return int((i * 100) % WIDTH * scale), int((i * 80) % HEIGHT * scale)
+    
+    def set_bubble_count(self, count):
+        self.bubble_count = count
+    
+    def draw(self, surface, camera, time):
+        self.bake(surface, self.bubble_count)
+        self.size = width, height = surface.get_size()
+        scale = width / WIDTH
+        surface.blit(self.gradients[self.size], (0, 0))
+        
+        offset_x = int(camera.x * 0.1 * scale) % width
+        offset_y = int((camera.y * 0.15 + time * 0.5) * scale) % height
+        self.offset = (offset_x, offset_y)
+        if not self.bubble_count:
+            return
+        surface.blit(self.layers[(self.size, self.bubble_count)], (0, 0),
+                     (width - offset_x, height - offset_y, width, height))
+
+    def bubble_rects(self):
+        # Window rects of the bubbles as last drawn
+        width, height = self.size
+        scale = width / WIDTH
+        offset_x, offset_y = self.offset
+        margin = int(4 / scale)
+        rects = []
+        for i in range(self.bubble_count):
+            bx, by = self.bubble_position(i, scale)
+            x = int((bx + offset_x) % width / scale)
+            y = int((by + offset_y) % height / scale)
+            rects.append(pygame.Rect(x - margin, y - margin, margin * 2, margin * 2))
+        return rects
+
+# ============= DIRTY RECTS =============
+class DirtyRects:
+    # Screen regions that changed this frame, for pygame.display.update.
+    # A region has to be presented on the frame something is drawn there
+    # and on the next one, when it is drawn over, so both frames' rects go
+    # out. Anything that moves the whole picture asks for a full flip.
+    def __init__(self, max_coverage=0.5):
+        self.max_coverage = max_coverage
+        self.rects = []
+        self.previous = []
+        self.full = True
+        self.camera = None
+        self.full_frames = 0
+        self.partial_frames = 0
+    
+    def add(self, rect):
+        self.rects.append(rect)
+    
+    def add_entities(self, entities, camera):
+        rects = self.rects
+        for entity in entities:
+            x, y = camera.apply(entity)
+            r = entity.draw_radius + 1
+            rects.append(pygame.Rect(int(x - r), int(y - r), int(r * 2) + 1, int(r * 2) + 1))
+    
+    def full_redraw(self):
+        self.full = True
+    
+    def present(self, camera):
+        # The world scrolls under the camera, so any camera move repaints it all
+        position = (int(camera.x), int(camera.y))
+        if position != self.camera:
+            self.camera = position
+            self.full = True
+        rects = self.previous + self.rects
+        if not self.full:
+            area = sum(rect.width * rect.height for rect in rects)
+            self.full = area > WIDTH * HEIGHT * self.max_coverage
+        if self.full:
+            pygame.display.flip()
+            self.full_frames += 1
+        else:
+            pygame.display.update(rects)
+            self.partial_frames += 1
+        self.previous = self.rects
+        self.rects = []
+        self.full = False
+
+# ============= PROFILING =============
+class FrameProfiler:
+    # Wall-clock time per named phase in milliseconds. Update phases and draw
+    # layers are kept apart because a frame may run several updates or none.
+    def __init__(self, window=600):
+        self.window = window
+        self.update_samples = {}
+        self.draw_samples = {}
+        self.samples = self.update_samples
+        self.last = 0.0
+        # Whole-frame time and net allocated blocks, sampled once per frame
+        self.frame_times = deque(maxlen=window)
+        self.frame_allocs = deque(maxlen=window)
+        self.last_frame = None
+        self.last_blocks = 0
+    
+    def frame(self):
+        now = time.perf_counter()
+        blocks = sys.getallocatedblocks()
+        if self.last_frame is not None:
+            self.frame_times.append((now - self.last_frame) * 1000)
+            self.frame_allocs.append(blocks - self.last_blocks)
+        self.last_frame = now
+        self.last_blocks = blocks
+    
+    def begin(self, draw=False):
+        self.samples = self.draw_samples if draw else self.update_samples
+        self.last = time.perf_counter()
+    
+    def mark(self, phase):
+        now = time.perf_counter()
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = deque(maxlen=self.window)
+        samples.append((now - self.last) * 1000)
+        self.last = now
+    
+    def reset(self):
+        self.update_samples.clear()
+        self.draw_samples.clear()
+        self.frame_times.clear()
+        self.frame_allocs.clear()
+        self.last_frame = None
+    
+    @staticmethod
+    def mean(samples):
+        return sum(samples) / len(samples) if samples else 0.0
+    
+    @staticmethod
+    def percentile(samples, pct):
+        ordered = sorted(samples)
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+    
+    @classmethod
+    def stats(cls, samples):
+        return {
+            'count': len(samples),
+            'mean': sum(samples) / len(samples) if samples else 0.0,
+            'p50': cls.percentile(samples, 50),
+            'p90': cls.percentile(samples, 90),
+            'p99': cls.percentile(samples, 99),
+            'max': max(samples) if samples else 0.0,
+        }
+    
+    def summary(self):
+        return {
+            'update': {name: self.stats(s) for name, s in self.update_samples.items()},
+            'draw': {name: self.stats(s) for name, s in self.draw_samples.items()},
+        }
 
 # ============= GAME =============
 class Game:
-    def __init__(self):
+    def __init__(self, controller=None, seed=None, recorder=None, vectorized=None, dirty_rects=False):
+        self.controller = controller if controller is not None else KeyboardController()
+        self.recorder = recorder
+        # Every simulation roll comes from a stream derived from the run seed,
+        # so a seed plus the recorded input reproduces a run exactly
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.spawn_rng = random.Random(f"{self.seed}:spawn")
+        self.loot_rng = random.Random(f"{self.seed}:loot")
+        self.level_up_rng = random.Random(f"{self.seed}:level_up")
+        self.fx_rng = random.Random(f"{self.seed}:fx")
+        # NumPy entity stores for late-game crowds. Below a few hundred
+        # entities the fixed cost of each array op outweighs the Python
+        # loops it replaces, so a game starts on plain lists and moves
+        # everything into the stores for good once the crowd passes
+        # NUMPY_CROWD_THRESHOLD. self.enemies, self.projectiles and
+        # self.xp_gems are then the stores' lists and must only be changed
+        # through add_enemy/add_projectile/add_gem and the stores.
+        if vectorized is None:
+            vectorized = np is not None
+        elif vectorized and np is None:
+            raise RuntimeError("The vectorized entity stores need NumPy")
+        self.vectorized = vectorized
+        self.enemy_store = None
+        self.projectile_store = None
+        self.gem_store = None
+        # Projectiles and gems are recycled through free lists
+        self.projectile_pool = ObjectPool(Projectile)
+        self.gem_pool = ObjectPool(XPGem)
+        if recorder is not None:
+            recorder.start(self.seed, vectorized)
         self.player = Player()
         self.camera = Camera()
         self.enemies = []
         self.projectiles = []
         self.xp_gems = []
-        self.obstacles = []
+        self.obstacles = ObstacleIndex(CHUNK_SIZE)
+        self.obstacle_tiles = ObstacleTiles(self.obstacles)
         self.time = 0
         self.enemy_spawn_timer = 0
         self.enemy_spawn_rate = 120
@@ -813,84 +2544,219 @@ class Game:
         self.paused = False
         self.show_level_up = False
         self.level_up_options = []
-        self.generated_chunks = set()
+        self.loaded_chunks = set()
+        self.opened_chests = set()
+        self.used_shrines = set()
+        self.player_chunk = None
         self.difficulty_scale = 1.0
         self.bosses_defeated = 0
         self.chests = []
         self.shrines = []
+        self.enemy_grid = SpatialHash(ENEMY_GRID_CELL_SIZE)
+        self.enemy_draw_pad = 0  # largest enemy draw_radius seen, for grid view queries
+        self.enemies_spawned = 0
+        self.view = (0, 0, WIDTH, HEIGHT)  # world rect drawn this frame
+        self.enemy_lod = EnemyLOD()
+        self.quality = QualityGovernor()
+        self.background = Background()
+        
+        # Frame phases, in order; a FrameProfiler attached here times each one
+        self.profiler = None
+        self.update_phases = [
+            ('player', self.update_player),
+            ('obstacle_generation', self.update_obstacle_generation),
+            ('auto_attack', self.update_weapons),
+            ('projectiles', self.update_projectiles),
+            ('spawning', self.update_spawning),
+            ('enemies', self.update_enemies),
+            ('collision', self.update_collisions),
+            ('gems', self.update_gems),
+            ('pickups', self.update_pickups),
+        ]
+        self.draw_layers = [
+            ('background', self.draw_background),
+            ('obstacles', self.draw_obstacles),
+            ('gems', self.draw_gems),
+            ('enemies', self.draw_enemies),
+            ('projectiles', self.draw_projectiles),
+            ('pickups', self.draw_pickups),
+            ('player', self.draw_player),
+            ('hud', self.draw_hud),
+            ('overlays', self.draw_overlays),
+        ]
+        
+        # Partial display updates (None flips the whole window every frame)
+        self.dirty = DirtyRects() if dirty_rects else None
+        # While paused or behind an overlay nothing moves, so a frame that
+        # would match the last one drawn is skipped
+        self.last_static_frame = None
+        self.overlay_surf = None
+        # Off-screen backdrop targets by render scale; baked for every
+        # quality level on the first frame
+        self.backdrops = None
+        self.backdrop = None  # this frame's
+        self.drawn_overlays = None  # overlays on screen after the last frame
         
         # Debug sliders
         self.show_debug = False
+        self.debug_panel_surf = None
         self.speed_slider = Slider(WIDTH - 250, 150, 200, 0.1, 5.0, 1.0, "Player Speed")
         self.damage_slider = Slider(WIDTH - 250, 220, 200, 0.1, 10.0, 1.0, "Player Damage")
     
+    def state_digest(self):
+        # Short fingerprint of the simulation state for comparing runs
+        state = (
+            self.time, self.player.x, self.player.y, self.player.hp,
+            self.player.level, self.player.xp, len(self.projectiles),
+            tuple((e.type, e.x, e.y, e.hp) for e in self.enemies),
+            tuple((g.x, g.y, g.value) for g in self.xp_gems),
+        )
+        return hashlib.sha1(repr(state).encode()).hexdigest()[:12]
+    
     def generate_obstacles_in_chunk(self, chunk_x, chunk_y):
         chunk_key = (chunk_x, chunk_y)
-        if chunk_key in self.generated_chunks:
+        if chunk_key in self.loaded_chunks:
             return
         
-        self.generated_chunks.add(chunk_key)
-        random.seed(hash(chunk_key))
+        self.loaded_chunks.add(chunk_key)
+        self.obstacle_tiles.invalidate(chunk_key)
+        # Chunk contents come from a per-chunk stream so an unloaded chunk
+        # regenerates identically when the player comes back
+        rng = random.Random(f"{self.seed}:chunk:{chunk_x}:{chunk_y}")
         
-        chunk_size = 500
+        chunk_size = CHUNK_SIZE
         base_x = chunk_x * chunk_size
         base_y = chunk_y * chunk_size
         
         if abs(chunk_x) <= 1 and abs(chunk_y) <= 1:
-            random.seed()
             return
         
-        num_obstacles = random.randint(3, 8)
+        num_obstacles = rng.randint(3, 8)
         
         for _ in range(num_obstacles):
-            obstacle_type = random.choice(['coral', 'rock', 'seaweed'])
+            obstacle_type = rng.choice(['coral', 'rock', 'seaweed'])
             
             if obstacle_type == 'seaweed':
-                size_w = random.randint(40, 60)
-                size_h = random.randint(60, 100)
+                size_w = rng.randint(40, 60)
+                size_h = rng.randint(60, 100)
             else:
-                size_w = random.randint(50, 100)
-                size_h = random.randint(50, 100)
+                size_w = rng.randint(50, 100)
+                size_h = rng.randint(50, 100)
             
-            x = base_x + random.randint(0, chunk_size - size_w)
-            y = base_y + random.randint(0, chunk_size - size_h)
+            x = base_x + rng.randint(0, chunk_size - size_w)
+            y = base_y + rng.randint(0, chunk_size - size_h)
             
-            self.obstacles.append(Obstacle(x, y, size_w, size_h, obstacle_type))
+            self.obstacles.add(Obstacle(x, y, size_w, size_h, obstacle_type))
         
-        random.seed()
-
-        #Create Chests & Shrines
-        if random.random() < 0.25:
+        #Create Chests & Shrines (skipping ones already used on an earlier visit)
+        if rng.random() < 0.25:
             for _ in range(10):
-                x = base_x + random.randint(50, 450)
-                y = base_y + random.randint(50, 450)
+                x = base_x + rng.randint(50, 450)
+                y = base_y + rng.randint(50, 450)
                 if not point_in_obstacle(x, y, self.obstacles):
-                    self.chests.append(Chest(x, y))
+                    if chunk_key not in self.opened_chests:
+                        self.chests.append(Chest(x, y, chunk_key))
                     break
 
-        if random.random() < 0.15:
+        if rng.random() < 0.15:
             for _ in range(10):
-                x = base_x + random.randint(50, 450)
-                y = base_y + random.randint(50, 450)
+                x = base_x + rng.randint(50, 450)
+                y = base_y + rng.randint(50, 450)
                 if not point_in_obstacle(x, y, self.obstacles):
-                    self.shrines.append(Shrine(x, y))
+                    if chunk_key not in self.used_shrines:
+                        self.shrines.append(Shrine(x, y, chunk_key))
                     break
 
     def update_obstacle_generation(self):
-        chunk_size = 500
-        player_chunk_x = int(self.player.x // chunk_size)
-        player_chunk_y = int(self.player.y // chunk_size)
+        # Only stream chunks when the player crosses into a new one
+        player_chunk = (int(self.player.x // CHUNK_SIZE), int(self.player.y // CHUNK_SIZE))
+        if player_chunk == self.player_chunk:
+            return
+        self.player_chunk = player_chunk
+        player_chunk_x, player_chunk_y = player_chunk
         
-        for dx in range(-3, 4):
-            for dy in range(-3, 4):
+        for dx in range(-CHUNK_LOAD_RADIUS, CHUNK_LOAD_RADIUS + 1):
+            for dy in range(-CHUNK_LOAD_RADIUS, CHUNK_LOAD_RADIUS + 1):
                 self.generate_obstacles_in_chunk(player_chunk_x + dx, player_chunk_y + dy)
         
-        self.obstacles = [obs for obs in self.obstacles 
-                         if abs(obs.x - self.player.x) < 2000 and abs(obs.y - self.player.y) < 2000]
+        unloaded = set()
+        for chunk_key in self.loaded_chunks:
+            if (abs(chunk_key[0] - player_chunk_x) > CHUNK_UNLOAD_RADIUS or
+                abs(chunk_key[1] - player_chunk_y) > CHUNK_UNLOAD_RADIUS):
+                unloaded.add(chunk_key)
+        if unloaded:
+            self.unload_chunks(unloaded)
+    
+    def unload_chunks(self, chunk_keys):
+        # Only the opened/used records outlive a chunk; everything else is
+        # regenerated from the chunk seed on the next visit
+        self.loaded_chunks -= chunk_keys
+        for chunk_key in chunk_keys:
+            self.obstacles.remove_chunk(chunk_key)
+            self.obstacle_tiles.invalidate(chunk_key)
+        self.chests = [c for c in self.chests if c.chunk_key not in chunk_keys]
+        self.shrines = [s for s in self.shrines if s.chunk_key not in chunk_keys]
+    
+    def use_stores(self):
+        # Moves every enemy, projectile and gem into the NumPy stores, in
+        # list order
+        self.enemy_store = EnemyStore()
+        self.projectile_store = ProjectileStore()
+        self.projectile_store.pool = self.projectile_pool
+        self.gem_store = GemStore()
+        self.gem_store.pool = self.gem_pool
+        for enemy in self.enemies:
+            self.enemy_store.add(enemy)
+        for proj in self.projectiles:
+            self.projectile_store.add(proj)
+        for gem in self.xp_gems:
+            self.gem_store.add(gem)
+        self.enemies = self.enemy_store.enemies
+        self.projectiles = self.projectile_store.projectiles
+        self.xp_gems = self.gem_store.gems
+    
+    def add_enemy(self, enemy):
+        enemy.spawn_id = self.enemies_spawned
+        self.enemies_spawned += 1
+        if enemy.draw_radius > self.enemy_draw_pad:
+            self.enemy_draw_pad = enemy.draw_radius
+        if self.enemy_store is not None:
+            self.enemy_store.add(enemy)
+        else:
+            self.enemies.append(enemy)
+    
+    def add_projectile(self, proj):
+        if self.projectile_store is not None:
+            self.projectile_store.add(proj)
+        else:
+            self.projectiles.append(proj)
+    
+    def add_gem(self, gem):
+        if self.gem_store is not None:
+            self.gem_store.add(gem)
+        else:
+            self.xp_gems.append(gem)
+    
+    def remove_gem_slots(self, slots):
+        # Slots must be unique; removing the highest first keeps the rest valid
+        if self.gem_store is not None:
+            self.gem_store.remove_slots(slots)
+            return
+        for i in sorted(slots, reverse=True):
+            self.gem_pool.release(self.xp_gems[i])
+            swap_remove(self.xp_gems, i)
+    
+    def rebuild_enemy_index(self):
+        store = self.enemy_store
+        if store is not None and store.n > 64:
+            n = store.n
+            self.enemy_grid.rebuild_arrays(store.enemies, store.x[:n], store.y[:n], store.size[:n])
+        else:
+            self.enemy_grid.rebuild(self.enemies)
     
     def spawn_enemy(self):
-        angle = random.uniform(0, 2 * math.pi)
-        distance = random.randint(700, 900)
+        angle = self.spawn_rng.uniform(0, 2 * math.pi)
+        distance = self.spawn_rng.randint(700, 900)
         
         x = self.player.x + math.cos(angle) * distance
         y = self.player.y + math.sin(angle) * distance
@@ -915,10 +2781,10 @@ class Game:
         if self.time > 3600:  # After 1 minute
             enemy_types.append('octopus')
         
-        enemy_type = random.choice(enemy_types)
+        enemy_type = self.spawn_rng.choice(enemy_types)
         
         # 10% chance for elite enemy after 20 seconds
-        is_elite = self.time > 1200 and random.random() < 0.1
+        is_elite = self.time > 1200 and self.spawn_rng.random() < 0.1
         
         count = 1
         if self.time > 1200:
@@ -927,14 +2793,14 @@ class Game:
             count = 3
 
         for i in range(count):
-            spread = random.uniform(-50, 50)
+            spread = self.spawn_rng.uniform(-50, 50)
             ex = x + math.cos(angle + i) * spread
             ey = y + math.sin(angle + i) * spread
-            self.enemies.append(Enemy(ex, ey, enemy_type, is_elite=is_elite, difficulty_scale=self.difficulty_scale))
+            self.add_enemy(Enemy(ex, ey, enemy_type, is_elite=is_elite, difficulty_scale=self.difficulty_scale, rng=self.spawn_rng))
     
     def spawn_boss(self):
         # Spawn boss far from player
-        angle = random.uniform(0, 2 * math.pi)
+        angle = self.spawn_rng.uniform(0, 2 * math.pi)
         distance = 1000
         
         x = self.player.x + math.cos(angle) * distance
@@ -947,12 +2813,16 @@ class Game:
         # Scale boss difficulty
         boss_scale = 1.0 + self.bosses_defeated * 0.5
         
-        self.enemies.append(Enemy(x, y, boss_type, is_boss=True, difficulty_scale=boss_scale))
+        self.add_enemy(Enemy(x, y, boss_type, is_boss=True, difficulty_scale=boss_scale, rng=self.spawn_rng))
         
         # Show boss warning
         print(f"BOSS SPAWNED: {boss_type.upper()}!")
     
     def auto_attack(self):
+        # One nearest-enemy lookup per frame, shared by every ready weapon.
+        # The enemy grid still matches self.enemies from the previous tick.
+        closest = None
+        searched = False
         for weapon in self.player.weapons:
             cooldown_key = weapon.type
             
@@ -960,17 +2830,9 @@ class Game:
                 self.player.weapon_cooldowns[cooldown_key] = 0
             
             if self.enemies and self.player.weapon_cooldowns[cooldown_key] <= 0:
-                # Find closest enemy
-                closest = None
-                min_dist = float('inf')
-                
-                for enemy in self.enemies:
-                    dx = enemy.x - self.player.x
-                    dy = enemy.y - self.player.y
-                    dist = math.sqrt(dx**2 + dy**2)
-                    if dist < min_dist:
-                        min_dist = dist
-                        closest = enemy
+                if not searched:
+                    closest = self.enemy_grid.nearest(self.player.x, self.player.y)
+                    searched = True
                 
                 if closest:
                     damage_mult = self.damage_slider.value
@@ -980,12 +2842,12 @@ class Game:
                             angle_offset = i * 0.3
                             target_x = closest.x + 100 * math.cos(self.player.facing_angle + angle_offset)
                             target_y = closest.y + 100 * math.sin(self.player.facing_angle + angle_offset)
-                            self.projectiles.append(Projectile(
+                            self.add_projectile(self.projectile_pool.acquire(
                                 self.player.x, self.player.y,
                                 target_x, target_y, weapon, damage_mult
                             ))
                     else:
-                        self.projectiles.append(Projectile(
+                        self.add_projectile(self.projectile_pool.acquire(
                             self.player.x, self.player.y,
                             closest.x, closest.y, weapon, damage_mult
                         ))
@@ -1023,11 +2885,13 @@ class Game:
         ])
         
         # Select 3 random options
-        self.level_up_options = random.sample(options, 3)
+        self.level_up_options = self.level_up_rng.sample(options, 3)
     
     def handle_level_up_choice(self, choice_index):
         if choice_index < len(self.level_up_options):
             option = self.level_up_options[choice_index]
+            if self.recorder is not None:
+                self.recorder.record_event(self.time, 'level_up', choice_index)
             
             if option['type'] == 'new_weapon':
                 self.player.add_weapon(option['weapon'])
@@ -1050,31 +2914,50 @@ class Game:
         
         self.time += 1
         
-        keys = pygame.key.get_pressed()
-        self.player.move(keys, self.obstacles, self.speed_slider.value)
+        profiler = self.profiler
+        if profiler is None:
+            for _, phase in self.update_phases:
+                phase()
+        else:
+            profiler.begin()
+            for name, phase in self.update_phases:
+                phase()
+                profiler.mark(name)
+    
+    def update_player(self):
+        direction = self.controller.get_direction(self)
+        if self.recorder is not None:
+            self.recorder.record_tick(self, direction)
+        self.player.move(direction, self.obstacles, self.speed_slider.value)
         
         self.camera.update(self.player)
-        self.update_obstacle_generation()
-        
+    
+    def update_weapons(self):
         # Update weapon cooldowns
         for key in self.player.weapon_cooldowns:
             self.player.weapon_cooldowns[key] -= 1
         
         self.auto_attack()
+    
+    def update_projectiles(self):
+        if self.projectile_store is not None:
+            self.projectile_store.step(self.player, self.obstacles, 1500)
+            return
         
-        alive = []
-        for p in self.projectiles:
-            if not p.update():
+        projectiles = self.projectiles
+        i = 0
+        while i < len(projectiles):
+            p = projectiles[i]
+            # Out of pierce, out of range, or stopped by coral/rock
+            if (not p.update() or
+                abs(p.x - self.player.x) > 1500 or abs(p.y - self.player.y) > 1500 or
+                p.collides_with_obstacle(self.obstacles)):
+                swap_remove(projectiles, i)
+                self.projectile_pool.release(p)
                 continue
-            if abs(p.x - self.player.x) > 1500 or abs(p.y - self.player.y) > 1500:
-                continue
-            if p.collides_with_obstacle(self.obstacles):
-                continue  # projectile dies on coral/rock
-            alive.append(p)
-
-        self.projectiles = alive
-
-        
+            i += 1
+    
+    def update_spawning(self):
         self.enemy_spawn_timer += 1
         if self.enemy_spawn_timer >= self.enemy_spawn_rate:
             self.spawn_enemy()
@@ -1088,25 +2971,46 @@ class Game:
         if self.boss_spawn_timer >= self.boss_spawn_interval:
             self.spawn_boss()
             self.boss_spawn_timer = 0
+    
+    def update_enemies(self):
+        if (self.vectorized and self.enemy_store is None and
+                len(self.enemies) + len(self.projectiles) + len(self.xp_gems) > NUMPY_CROWD_THRESHOLD):
+            self.use_stores()
+        if self.enemy_store is not None:
+            self.enemy_store.update(self.player)
+            self.enemy_store.cull(self.player.x, self.player.y, 2000)
+            return
         
         for enemy in self.enemies:
             enemy.update(self.player, self.obstacles, self.time)
         
         self.enemies = [e for e in self.enemies if abs(e.x - self.player.x) < 2000 and abs(e.y - self.player.y) < 2000]
-        
-        for proj in self.projectiles[:]:
-            for enemy in self.enemies[:]:
+    
+    def update_collisions(self):
+        self.rebuild_enemy_index()
+        
+        store = self.projectile_store
+        if store is not None:
+            # Broad phase for every projectile at once
+            n = store.n
+            candidates = self.enemy_grid.query_many(store.x[:n], store.y[:n], store.hit_radius[:n])
+        else:
+            candidates = (self.enemy_grid.query(p.x, p.y, getattr(p.weapon, 'aoe_radius', p.size))
+                          for p in self.projectiles)
+        
+        killed = False
+        for proj, nearby in zip(self.projectiles, candidates):
+            aoe_radius = getattr(proj.weapon, 'aoe_radius', None)
+            for enemy in nearby:
+                if enemy.hp <= 0:
+                    continue  # killed earlier this tick
                 dx = proj.x - enemy.x
                 dy = proj.y - enemy.y
-                dist = math.sqrt(dx**2 + dy**2)
                 
-                hit_radius = enemy.size + proj.size
-                if hasattr(proj.weapon, 'aoe_radius'):
-                    hit_radius = proj.weapon.aoe_radius
+                hit_radius = aoe_radius if aoe_radius is not None else enemy.size + proj.size
                 
-                if dist < hit_radius:
-                    enemy_id = id(enemy)
-                    if proj.hit(enemy_id):
+                if dx * dx + dy * dy < hit_radius * hit_radius:
+                    if proj.hit(enemy):
                         if enemy.take_damage(proj.damage):
                             # Drop more XP for elites and bosses
                             xp_drop = enemy.xp_value
@@ -1114,52 +3018,122 @@ class Game:
                                 self.bosses_defeated += 1
                                 # Bosses drop multiple XP gems
                                 for _ in range(10):
-                                    offset_x = random.randint(-50, 50)
-                                    offset_y = random.randint(-50, 50)
-                                    self.xp_gems.append(XPGem(enemy.x + offset_x, enemy.y + offset_y, xp_drop // 10))
+                                    offset_x = self.loot_rng.randint(-50, 50)
+                                    offset_y = self.loot_rng.randint(-50, 50)
+                                    self.add_gem(self.gem_pool.acquire(enemy.x + offset_x, enemy.y + offset_y, xp_drop // 10, self.fx_rng))
                             else:
-                                self.xp_gems.append(XPGem(enemy.x, enemy.y, xp_drop))
+                                self.add_gem(self.gem_pool.acquire(enemy.x, enemy.y, xp_drop, self.fx_rng))
                             
-                            if enemy in self.enemies:
-                                self.enemies.remove(enemy)
+                            self.enemy_grid.remove(enemy)
+                            killed = True
+        
+        if killed:
+            if self.enemy_store is not None:
+                self.enemy_store.remove_dead()
+            else:
+                self.enemies = [e for e in self.enemies if e.hp > 0]
         
         # Remove projectiles with no pierce left
-        self.projectiles = [p for p in self.projectiles if p.pierce_count > 0]
+        if store is not None:
+            store.remove_spent()
+        else:
+            projectiles = self.projectiles
+            for i in range(len(projectiles) - 1, -1, -1):
+                if projectiles[i].pierce_count <= 0:
+                    self.projectile_pool.release(projectiles[i])
+                    swap_remove(projectiles, i)
+        
+        # Only the earliest spawned touching enemy deals damage each tick
+        if self.enemy_store is not None:
+            attacker = self.enemy_store.first_contact(self.player.x, self.player.y, self.player.size)
+        else:
+            attacker = None
+            for enemy in self.enemies:
+                dx = self.player.x - enemy.x
+                dy = self.player.y - enemy.y
+                if math.sqrt(dx**2 + dy**2) < self.player.size + enemy.size:
+                    if attacker is None or enemy.spawn_id < attacker.spawn_id:
+                        attacker = enemy
+        if attacker is not None:
+            if self.player.take_damage(attacker.damage):
+                self.game_over = True
+    
+    def update_gems(self):
+        if self.time % GEM_COALESCE_INTERVAL == 0 and len(self.xp_gems) >= GEM_COALESCE_MIN_GEMS:
+            self.coalesce_gems()
         
-        damage_taken = False
-        for enemy in self.enemies:
-            dx = self.player.x - enemy.x
-            dy = self.player.y - enemy.y
-            if math.sqrt(dx**2 + dy**2) < self.player.size + enemy.size:
-                if not damage_taken:
-                    if self.player.take_damage(enemy.damage):
-                        self.game_over = True
-                    damage_taken = True
-        
-        for gem in self.xp_gems[:]:
-            if gem.update(self.player, self.time):
-                level_up = self.player.gain_xp(gem.value)
-                self.xp_gems.remove(gem)
-                if level_up:
-                    self.show_level_up = True
-                    self.generate_level_up_options()
-        
-        self.xp_gems = [g for g in self.xp_gems if abs(g.x - self.player.x) < 2000 and abs(g.y - self.player.y) < 2000]
-
+        player = self.player
+        if self.gem_store is not None:
+            collected, far = self.gem_store.step(player, GEM_MAGNET_SPEED, 2000)
+        else:
+            # One pass: squared distances for everything, a sqrt and a move
+            # only for gems inside their collection radius
+            collected = []
+            far = []
+            px = player.x
+            py = player.y
+            for i, gem in enumerate(self.xp_gems):
+                gem.prev_x = gem.x
+                gem.prev_y = gem.y
+                dx = px - gem.x
+                dy = py - gem.y
+                dist_sq = dx * dx + dy * dy
+                reach = player.size + gem.size
+                if dist_sq < reach * reach:
+                    collected.append(i)
+                elif abs(dx) >= 2000 or abs(dy) >= 2000:
+                    far.append(i)
+                if 0 < dist_sq < gem.collection_radius * gem.collection_radius:
+                    dist = math.sqrt(dist_sq)
+                    gem.x += dx / dist * GEM_MAGNET_SPEED
+                    gem.y += dy / dist * GEM_MAGNET_SPEED
+        
+        if not collected and not far:
+            return
+        for i in collected:
+            if player.gain_xp(self.xp_gems[i].value):
+                self.show_level_up = True
+                self.generate_level_up_options()
+        self.remove_gem_slots(collected + far)
+    
+    def coalesce_gems(self):
+        # Fuse the gems of each densely filled grid cell into the first one
+        # found there, which carries the summed value. Sparse cells are left
+        # alone however many gems are on the field.
+        cells = {}
+        for i, gem in enumerate(self.xp_gems):
+            key = (int(gem.x // GEM_COALESCE_CELL), int(gem.y // GEM_COALESCE_CELL))
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [i]
+            else:
+                cell.append(i)
+        gems = self.xp_gems
+        merged = []
+        for cell in cells.values():
+            if len(cell) >= GEM_COALESCE_MIN_GEMS:
+                keeper = gems[cell[0]]
+                for i in cell[1:]:
+                    keeper.value += gems[i].value
+                merged.extend(cell[1:])
+        self.remove_gem_slots(merged)
+    
+    def update_pickups(self):
         #Chests & Shrines
         for chest in self.chests[:]:
             if chest.update(self.player):
                 # Big XP reward
-                self.xp_gems.append(XPGem(chest.x, chest.y, 50))
+                self.add_gem(self.gem_pool.acquire(chest.x, chest.y, 50, self.fx_rng))
 
                 # Random weapon upgrade
-                self.player.add_weapon(random.choice(['harpoon','trident','net','torpedo']))
+                self.player.add_weapon(self.loot_rng.choice(['harpoon','trident','net','torpedo']))
 
+                self.opened_chests.add(chest.chunk_key)
                 self.chests.remove(chest)
 
         for shrine in self.shrines[:]:
             if shrine.update(self.player):
-                buff = random.choice(['damage','speed','cooldown','heal'])
+                buff = self.loot_rng.choice(['damage','speed','cooldown','heal'])
 
                 if buff == 'damage':
                     for w in self.player.weapons:
@@ -1175,168 +3149,470 @@ class Game:
                 elif buff == 'heal':
                     self.player.hp = self.player.max_hp
 
+                self.used_shrines.add(shrine.chunk_key)
                 self.shrines.remove(shrine)
-
     
-    def draw(self):
-        # Ocean gradient background
-        for y in range(0, HEIGHT, 2):
-            color_ratio = y / HEIGHT
-            r = int(OCEAN_BLUE[0] + (DARK_BLUE[0] - OCEAN_BLUE[0]) * color_ratio)
-            g = int(OCEAN_BLUE[1] + (DARK_BLUE[1] - OCEAN_BLUE[1]) * color_ratio)
-            b = int(OCEAN_BLUE[2] + (DARK_BLUE[2] - OCEAN_BLUE[2]) * color_ratio)
-            pygame.draw.line(screen, (r, g, b), (0, y), (WIDTH, y), 2)
-        
-        # Bubbles
-        for i in range(20):
-            bubble_x = (self.camera.x * 0.1 + i * 100) % WIDTH
-            bubble_y = (self.camera.y * 0.15 + i * 80 + self.time * 0.5) % HEIGHT
-            pygame.draw.circle(screen, (50, 80, 140), (int(bubble_x), int(bubble_y)), 3)
-        
-        for obstacle in self.obstacles:
-            if (obstacle.x + obstacle.width > self.camera.x and obstacle.x < self.camera.x + WIDTH and
-                obstacle.y + obstacle.height > self.camera.y and obstacle.y < self.camera.y + HEIGHT):
-                obstacle.draw(screen, self.camera)
-        
-        for gem in self.xp_gems:
-            gem.draw(screen, self.camera, self.time)
-        
-        for enemy in self.enemies:
-            enemy.draw(screen, self.camera, self.time)
-        
-        for proj in self.projectiles:
+    def draw(self, alpha=1.0):
+        # alpha: how far the frame sits between the previous and current tick
+        if self.game_over or self.paused or self.show_level_up:
+            alpha = 1.0
+            # The live debug readout is the only thing that still changes
+            frame = (self.time, self.game_over, self.paused, self.show_level_up, self.show_debug,
+                     tuple(option['name'] for option in self.level_up_options))
+            if frame == self.last_static_frame and not self.show_debug:
+                return False
+            self.last_static_frame = frame
+        else:
+            self.last_static_frame = None
+        # Opening or closing an overlay or the debug panel changes the whole
+        # picture, even while the camera is still
+        overlays = (self.show_level_up, self.game_over, self.show_debug)
+        if overlays != self.drawn_overlays:
+            self.drawn_overlays = overlays
+            if self.dirty is not None:
+                self.dirty.full_redraw()
+        self.camera.interpolate(self.player, alpha)
+        self.view = (self.camera.x - VIEW_MARGIN, self.camera.y - VIEW_MARGIN,
+                     self.camera.x + WIDTH + VIEW_MARGIN, self.camera.y + HEIGHT + VIEW_MARGIN)
+        if self.backdrops is None:
+            self.prepare_backdrops(screen)
+        quality = self.quality.settings
+        self.background.set_bubble_count(quality['bubbles'])
+        self.obstacle_tiles.set_style(quality['sway'], quality['scale'])
+        self.enemy_lod.floor = quality['lod_floor']
+        self.backdrop = self.backdrop_target(screen, quality['scale'])
+        
+        profiler = self.profiler
+        if profiler is None:
+            for _, layer in self.draw_layers:
+                layer(screen)
+            self.present()
+        else:
+            profiler.frame()
+            profiler.begin(draw=True)
+            for name, layer in self.draw_layers:
+                layer(screen)
+                profiler.mark(name)
+            self.present()
+            profiler.mark('present')
+        return True
+    
+    def present(self):
+        if self.dirty is None:
+            pygame.display.flip()
+        else:
+            self.dirty.present(self.camera)
+    
+    def request_redraw(self):
+        # The window needs repainting, e.g. after being uncovered
+        self.last_static_frame = None
+        if self.dirty is not None:
+            self.dirty.full_redraw()
+    
+    def backdrop_target(self, screen, scale):
+        if scale == 1:
+            return screen
+        target = self.backdrops.get(scale)
+        if target is None:
+            target = pygame.Surface((int(WIDTH * scale), int(HEIGHT * scale)), 0, screen)
+            self.backdrops[scale] = target
+        return target
+    
+    def prepare_backdrops(self, screen):
+        # Bakes the background for every quality level, so the governor
+        # never waits on a bake when it changes level
+        self.backdrops = {}
+        for _, settings in QUALITY_LEVELS:
+            self.background.bake(self.backdrop_target(screen, settings['scale']), settings['bubbles'])
+    
+    def draw_background(self, screen):
+        # Ocean gradient and bubbles
+        self.background.draw(self.backdrop, self.camera, self.time)
+        if self.dirty is not None:
+            self.dirty.rects.extend(self.background.bubble_rects())
+    
+    def visible(self, entities, store=None, grid=None, pad=0):
+        # Entities whose draw bounds (center +- draw_radius) overlap the view.
+        # A store tests its arrays in one pass (worth it past a few dozen
+        # items); a grid narrows the candidates to cells near the view first.
+        left, top, right, bottom = self.view
+        if store is not None and store.n > 64:
+            return store.in_view(left, top, right, bottom)
+        if grid is not None:
+            entities = grid.query_rect(left - pad, top - pad, right + pad, bottom + pad)
+        return [e for e in entities
+                if e.x + e.draw_radius > left and e.x - e.draw_radius < right and
+                e.y + e.draw_radius > top and e.y - e.draw_radius < bottom]
+    
+    def draw_obstacles(self, screen):
+        self.obstacle_tiles.draw(self.backdrop, self.camera, self.view, self.loaded_chunks)
+        if self.backdrop is not screen:
+            # The backdrop is complete; everything after draws at full size
+            pygame.transform.scale(self.backdrop, (WIDTH, HEIGHT), screen)
+        swaying = self.obstacle_tiles.draw_swaying(screen, self.camera, self.view, self.time)
+        if self.dirty is not None:
+            for obstacle in swaying:
+                self.dirty.add(self.camera.apply_rect(obstacle.rect).inflate(14, 4))
+    
+    def draw_gems(self, screen):
+        visible = self.visible(self.xp_gems, self.gem_store)
+        bob = self.quality.settings['gem_float']
+        for gem in visible:
+            gem.draw(screen, self.camera, self.time, bob)
+        if self.dirty is not None:
+            self.dirty.add_entities(visible, self.camera)
+    
+    def draw_enemies(self, screen):
+        visible = self.visible(self.enemies, self.enemy_store, self.enemy_grid, self.enemy_draw_pad)
+        lod = self.enemy_lod.choose(len(visible))
+        quality = self.quality.settings
+        glow, tentacles = quality['glow'], quality['tentacles']
+        start = time.perf_counter()
+        for enemy in visible:
+            enemy.draw(screen, self.camera, self.time, lod, glow, tentacles)
+        self.enemy_lod.record(lod, len(visible), (time.perf_counter() - start) * 1000)
+        enemy_atlas.work()
+        if self.dirty is not None:
+            self.dirty.add_entities(visible, self.camera)
+    
+    def draw_projectiles(self, screen):
+        visible = self.visible(self.projectiles, self.projectile_store)
+        for proj in visible:
             proj.draw(screen, self.camera)
-
-        for chest in self.chests:
+        if self.dirty is not None:
+            self.dirty.add_entities(visible, self.camera)
+    
+    def draw_pickups(self, screen):
+        chests = self.visible(self.chests)
+        for chest in chests:
             chest.draw(screen, self.camera)
 
-        for shrine in self.shrines:
+        shrines = self.visible(self.shrines)
+        for shrine in shrines:
             shrine.draw(screen, self.camera)
-
-        
+        if self.dirty is not None:
+            self.dirty.add_entities(chests, self.camera)
+            self.dirty.add_entities(shrines, self.camera)
+    
+    def draw_player(self, screen):
         self.player.draw(screen, self.camera)
-        
+        if self.dirty is not None:
+            x, y = self.camera.apply(self.player)
+            self.dirty.add(pygame.Rect(int(x) - 45, int(y) - 45, 90, 90))
+    
+    def draw_hud(self, screen):
         # UI
         pygame.draw.rect(screen, RED, (10, 10, 200, 30))
         pygame.draw.rect(screen, GREEN, (10, 10, 200 * (self.player.hp / self.player.max_hp), 30))
-        hp_text = small_font.render(f"HP: {int(self.player.hp)}/{self.player.max_hp}", True, WHITE)
+        hp_text = render_text(small_font, f"HP: {int(self.player.hp)}/{self.player.max_hp}", WHITE)
         screen.blit(hp_text, (15, 15))
         
         pygame.draw.rect(screen, (50, 50, 50), (10, 50, 200, 20))
         pygame.draw.rect(screen, WHITE, (10, 50, 200 * (self.player.xp / self.player.xp_to_next), 20))
-        xp_text = small_font.render(f"Level {self.player.level}", True, WHITE)
+        xp_text = render_text(small_font, f"Level {self.player.level}", WHITE)
         screen.blit(xp_text, (15, 50))
         
-        stats_text = small_font.render(f"Time: {self.time // FPS}s | Enemies: {len(self.enemies)} | Difficulty: {self.difficulty_scale:.1f}x", True, WHITE)
+        stats_text = render_text(small_font, f"Time: {self.time // FPS}s | Enemies: {len(self.enemies)} | Difficulty: {self.difficulty_scale:.1f}x", WHITE)
         screen.blit(stats_text, (10, 80))
         
         # Boss timer
         boss_time_left = (self.boss_spawn_interval - self.boss_spawn_timer) // FPS
         if boss_time_left < 10:
-            boss_text = small_font.render(f"BOSS IN: {boss_time_left}s", True, RED if boss_time_left < 5 else YELLOW)
+            boss_text = render_text(small_font, f"BOSS IN: {boss_time_left}s", RED if boss_time_left < 5 else YELLOW)
             screen.blit(boss_text, (WIDTH - 200, 10))
         
         # Weapon display
         weapon_y = 110
         for weapon in self.player.weapons:
-            weapon_text = small_font.render(f"{weapon.type.title()} Lv{weapon.level}", True, WHITE)
+            weapon_text = render_text(small_font, f"{weapon.type.title()} Lv{weapon.level}", WHITE)
             screen.blit(weapon_text, (10, weapon_y))
             weapon_y += 25
         
         # Debug panel
         if self.show_debug:
-            panel_x = WIDTH - 280
-            panel_y = 100
-            panel_width = 270
-            panel_height = 180
-            
-            # Semi-transparent background
-            debug_surf = pygame.Surface((panel_width, panel_height))
-            debug_surf.set_alpha(220)
-            debug_surf.fill((20, 20, 40))
-            screen.blit(debug_surf, (panel_x, panel_y))
-            
-            # Border
-            pygame.draw.rect(screen, (100, 100, 150), (panel_x, panel_y, panel_width, panel_height), 2)
-            
-            # Title
-            debug_title = small_font.render("DEBUG CONTROLS", True, YELLOW)
-            screen.blit(debug_title, (panel_x + 10, panel_y + 10))
-            
-            # Sliders
-            self.speed_slider.draw(screen)
-            self.damage_slider.draw(screen)
-            
-            # Instructions
-            toggle_text = tiny_font.render("Press T to toggle", True, (150, 150, 150))
-            screen.blit(toggle_text, (panel_x + 10, panel_y + panel_height - 25))
+            self.draw_debug_panel(screen)
         else:
             # Show hint to open debug
-            hint_text = tiny_font.render("Press T for debug controls", True, (100, 100, 100))
+            hint_text = render_text(tiny_font, "Press T for debug controls", (100, 100, 100))
             screen.blit(hint_text, (WIDTH - 200, HEIGHT - 30))
         
+        if self.dirty is not None:
+            self.dirty.add(pygame.Rect(0, 0, 600, weapon_y))
+            self.dirty.add(pygame.Rect(WIDTH - 200, 10, 200, 30))
+            if self.show_debug:
+                self.dirty.add(pygame.Rect(DEBUG_PANEL_RECT))
+            else:
+                self.dirty.add(pygame.Rect(WIDTH - 200, HEIGHT - 30, 200, 20))
+    
+    def toggle_debug(self):
+        # The profiler only runs while its readout is on screen
+        self.show_debug = not self.show_debug
+        self.profiler = FrameProfiler(window=120) if self.show_debug else None
+    
+    def draw_debug_panel(self, screen):
+        panel_x, panel_y, panel_width, panel_height = DEBUG_PANEL_RECT
+        
+        # Semi-transparent background, built once so it doesn't skew the readout
+        if self.debug_panel_surf is None:
+            self.debug_panel_surf = pygame.Surface((panel_width, panel_height))
+            self.debug_panel_surf.set_alpha(220)
+            self.debug_panel_surf.fill((20, 20, 40))
+        screen.blit(self.debug_panel_surf, (panel_x, panel_y))
+        
+        # Border
+        pygame.draw.rect(screen, (100, 100, 150), (panel_x, panel_y, panel_width, panel_height), 2)
+        
+        # Title
+        debug_title = render_text(small_font, "DEBUG CONTROLS", YELLOW)
+        screen.blit(debug_title, (panel_x + 10, panel_y + 10))
+        
+        # Sliders
+        self.speed_slider.draw(screen)
+        self.damage_slider.draw(screen)
+        
+        if self.profiler is not None:
+            self.draw_profiler(screen, panel_x + 10, panel_y + 150, panel_width - 20)
+        
+        # Instructions
+        toggle_text = render_text(tiny_font, "T: toggle  Q: pin quality  L: pin LOD", (150, 150, 150))
+        screen.blit(toggle_text, (panel_x + 10, panel_y + panel_height - 25))
+    
+    def draw_profiler(self, screen, x, y, width):
+        profiler = self.profiler
+        line_height = 14
+        
+        def row(label, value, color=WHITE):
+            screen.blit(render_text(tiny_font, label, color), (x, y))
+            value_text = debug_text_cache.render(tiny_font, value, color)
+            screen.blit(value_text, (x + width - value_text.get_width(), y))
+        
+        # Average ms per update phase and per draw layer
+        for heading, samples in (("UPDATE (ms/tick)", profiler.update_samples),
+                                 ("DRAW (ms/frame)", profiler.draw_samples)):
+            total = sum(profiler.mean(s) for s in samples.values())
+            row(heading, f"{total:.2f}", YELLOW)
+            y += line_height
+            for name, phase_samples in samples.items():
+                row("  " + name, f"{profiler.mean(phase_samples):.2f}", (200, 200, 200))
+                y += line_height
+            y += 4
+        
+        # Entity counts and allocation churn
+        counts = (f"Enemies {len(self.enemies)}  Proj {len(self.projectiles)}  "
+                  f"Gems {len(self.xp_gems)}")
+        screen.blit(debug_text_cache.render(tiny_font, counts, WHITE), (x, y))
+        y += line_height
+        counts = (f"Obstacles {len(self.obstacles)}  Chests {len(self.chests)}  "
+                  f"Shrines {len(self.shrines)}")
+        screen.blit(debug_text_cache.render(tiny_font, counts, WHITE), (x, y))
+        y += line_height
+        for label, pool in (("Projectile pool", self.projectile_pool), ("Gem pool", self.gem_pool)):
+            row(label, f"{pool.hits} hit / {pool.misses} miss ({pool.hit_rate():.0%})")
+            y += line_height
+        row("Enemy LOD", LOD_NAMES[self.enemy_lod.level] +
+            (" (pinned)" if self.enemy_lod.pinned is not None else ""))
+        y += line_height
+        row("Quality", f"{self.quality.name} {self.quality.frame_ms:.1f} ms" +
+            (" (pinned)" if self.quality.pinned is not None else " (auto)"))
+        y += line_height
+        row("Net alloc blocks/frame", f"{profiler.mean(profiler.frame_allocs):.0f}")
+        y += line_height + 4
+        
+        # Rolling frame-time graph with the 60 FPS budget marked
+        frame_ms = profiler.mean(profiler.frame_times)
+        row("Frame time", f"{frame_ms:.1f} ms ({1000 / frame_ms if frame_ms else 0:.0f} FPS)")
+        y += line_height + 2
+        graph_height = 60
+        scale_ms = 50.0
+        pygame.draw.rect(screen, (10, 10, 25), (x, y, width, graph_height))
+        budget_y = y + graph_height - graph_height * (1000 / FPS) / scale_ms
+        pygame.draw.line(screen, (80, 120, 80), (x, budget_y), (x + width, budget_y))
+        times = list(profiler.frame_times)
+        if len(times) > 1:
+            step = width / (profiler.window - 1)
+            points = [(x + i * step, y + graph_height - graph_height * min(t, scale_ms) / scale_ms)
+                      for i, t in enumerate(times)]
+            pygame.draw.lines(screen, ORANGE, False, points)
+    
+    def dim_screen(self, screen):
+        if self.overlay_surf is None:
+            self.overlay_surf = pygame.Surface((WIDTH, HEIGHT))
+            self.overlay_surf.set_alpha(200)
+            self.overlay_surf.fill(DARK_BLUE)
+        screen.blit(self.overlay_surf, (0, 0))
+        if self.dirty is not None:
+            self.dirty.full_redraw()
+    
+    def draw_overlays(self, screen):
         if self.show_level_up:
-            overlay = pygame.Surface((WIDTH, HEIGHT))
-            overlay.set_alpha(200)
-            overlay.fill(DARK_BLUE)
-            screen.blit(overlay, (0, 0))
+            self.dim_screen(screen)
             
-            title = font.render("LEVEL UP!", True, YELLOW)
+            title = render_text(font, "LEVEL UP!", YELLOW)
             screen.blit(title, (WIDTH//2 - title.get_width()//2, 150))
             
             for i, option in enumerate(self.level_up_options):
-                choice_text = font.render(f"{i+1} - {option['name']}", True, WHITE)
+                choice_text = render_text(font, f"{i+1} - {option['name']}", WHITE)
                 screen.blit(choice_text, (WIDTH//2 - choice_text.get_width()//2, 300 + i * 50))
         
         if self.game_over:
-            overlay = pygame.Surface((WIDTH, HEIGHT))
-            overlay.set_alpha(200)
-            overlay.fill(DARK_BLUE)
-            screen.blit(overlay, (0, 0))
+            self.dim_screen(screen)
             
-            game_over_text = font.render("GAME OVER", True, RED)
+            game_over_text = render_text(font, "GAME OVER", RED)
             screen.blit(game_over_text, (WIDTH//2 - game_over_text.get_width()//2, HEIGHT//2 - 50))
             
-            stats = small_font.render(f"Survived: {self.time // FPS}s | Level: {self.player.level}", True, WHITE)
+            stats = render_text(small_font, f"Survived: {self.time // FPS}s | Level: {self.player.level}", WHITE)
             screen.blit(stats, (WIDTH//2 - stats.get_width()//2, HEIGHT//2))
             
-            restart = small_font.render("Press R to Restart", True, WHITE)
+            restart = render_text(small_font, "Press R to Restart", WHITE)
             screen.blit(restart, (WIDTH//2 - restart.get_width()//2, HEIGHT//2 + 50))
-        
-        pygame.display.flip()
 
-def main():
-    game = Game()
+def run_headless(ticks, controller=None, seed=None, recorder=None, vectorized=None):
+    # Simulation only: no window, no drawing and no frame cap
+    controller = controller if controller is not None else WanderController()
+    game = Game(controller, seed=seed, recorder=recorder, vectorized=vectorized)
+    start = time.perf_counter()
+    while game.time < ticks and not game.game_over:
+        if game.show_level_up:
+            choice = game.controller.choose_level_up(game)
+            if choice is None:
+                break
+            game.handle_level_up_choice(choice)
+        game.update()
+    elapsed = time.perf_counter() - start
+    if recorder is not None:
+        recorder.save()
+    
+    print(f"Simulated {game.time} ticks ({game.time // FPS}s) in {elapsed:.2f}s | "
+          f"Level: {game.player.level} | Enemies: {len(game.enemies)} | "
+          f"Game over: {game.game_over} | Seed: {game.seed} | State: {game.state_digest()}")
+    return game
+
+def main(seed=None, replay=None, recorder=None, render_fps=RENDER_FPS, vectorized=None, dirty_rects=False,
+         quality=None, lod=None):
+    init_display()
+    game = Game(replay, seed=seed, recorder=recorder, vectorized=vectorized, dirty_rects=dirty_rects)
+    game.quality.pin(quality)
+    game.enemy_lod.pinned = lod
+    # Keys and sliders must not feed into a replayed session
+    interactive = replay is None
     running = True
     
+    # Fixed-timestep loop: the simulation advances in SIM_DT ticks while
+    # frames render as fast as render_fps allows, interpolating in between
+    accumulator = 0.0
+    previous = time.perf_counter()
+    
     while running:
-        clock.tick(FPS)
+        clock.tick(render_fps)
+        now = time.perf_counter()
+        accumulator += min(now - previous, MAX_FRAME_TIME)
+        previous = now
         
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                game.request_redraw()
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_t:
-                    game.show_debug = not game.show_debug
-                elif game.show_level_up:
+                    game.toggle_debug()
+                elif event.key == pygame.K_q and game.show_debug:
+                    # Quality only affects drawing, so replays may change it too
+                    game.quality.cycle_pin()
+                elif event.key == pygame.K_l and game.show_debug:
+                    game.enemy_lod.cycle_pin()
+                elif game.show_level_up and interactive:
                     if event.key == pygame.K_1:
                         game.handle_level_up_choice(0)
                     elif event.key == pygame.K_2:
                         game.handle_level_up_choice(1)
                     elif event.key == pygame.K_3:
                         game.handle_level_up_choice(2)
-                elif game.game_over and event.key == pygame.K_r:
-                    game = Game()
+                elif game.game_over and event.key == pygame.K_r and interactive:
+                    # The recording file keeps the most recent session
+                    if recorder is not None:
+                        recorder.save()
+                    pinned = game.quality.pinned
+                    pinned_lod = game.enemy_lod.pinned
+                    game = Game(recorder=recorder, vectorized=vectorized, dirty_rects=dirty_rects)
+                    game.quality.pin(pinned)
+                    game.enemy_lod.pinned = pinned_lod
             
             # Handle slider events when debug is open
-            if game.show_debug and not game.game_over and not game.show_level_up:
+            if game.show_debug and not game.game_over and not game.show_level_up and interactive:
                 game.speed_slider.handle_event(event)
                 game.damage_slider.handle_event(event)
         
-        game.update()
-        game.draw()
+        ticks = 0
+        while accumulator >= SIM_DT and ticks < MAX_TICKS_PER_FRAME:
+            if game.show_level_up:
+                choice = game.controller.choose_level_up(game)
+                if choice is not None:
+                    game.handle_level_up_choice(choice)
+            game.update()
+            accumulator -= SIM_DT
+            ticks += 1
+        if ticks == MAX_TICKS_PER_FRAME:
+            # Too far behind to catch up; drop the backlog instead of spiralling
+            accumulator = min(accumulator, SIM_DT)
+        
+        # The governor sees the frame's work, not the wait for the frame cap
+        if game.draw(accumulator / SIM_DT):
+            game.quality.record((time.perf_counter() - now) * 1000)
     
+    if recorder is not None:
+        recorder.save()
     pygame.quit()
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Shark Survivors")
+    parser.add_argument("--headless", action="store_true",
+                        help="run the simulation without a window or drawing")
+    parser.add_argument("--ticks", type=int, default=None,
+                        help="ticks to simulate in headless mode (default: 10 minutes, or the whole replay)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="world and simulation seed")
+    parser.add_argument("--input-seed", type=int, default=None,
+                        help="seed for the scripted headless input")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record the session's input to FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="replay a session recorded with --record")
+    parser.add_argument("--no-numpy", action="store_true",
+                        help="keep the pure-Python entity updates even past "
+                             f"{NUMPY_CROWD_THRESHOLD} live entities, where the NumPy stores take over")
+    parser.add_argument("--render-fps", type=int, default=RENDER_FPS,
+                        help="render frame cap, independent of the simulation rate (0 = uncapped)")
+    parser.add_argument("--no-atlas", action="store_true",
+                        help="draw enemies procedurally instead of from baked sprite atlases")
+    parser.add_argument("--atlas-cache", action="store_true",
+                        help=f"keep baked sprite atlases on disk in {ATLAS_CACHE_DIR}")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="only present the changed parts of the window while the camera is still")
+    parser.add_argument("--quality", choices=QUALITY_NAMES, default=None,
+                        help="pin the render quality instead of adapting it to the frame time")
+    parser.add_argument("--lod", choices=LOD_NAMES, default=None,
+                        help="pin the enemy detail level instead of choosing it from the crowd size")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    main()
+    args = parse_args(sys.argv[1:])
+    replay = ReplayController.load(args.replay) if args.replay else None
+    recorder = InputRecorder(args.record) if args.record else None
+    seed = replay.seed if replay is not None else args.seed
+    vectorized = False if args.no_numpy else None
+    enemy_atlas.enabled = not args.no_atlas
+    if args.atlas_cache:
+        enemy_atlas.cache_dir = ATLAS_CACHE_DIR
+    if replay is not None:
+        vectorized = replay.vectorized
+    if args.headless:
+        controller = replay if replay is not None else WanderController(args.input_seed)
+        ticks = args.ticks
+        if ticks is None:
+            ticks = replay.total_ticks if replay is not None else FPS * 600
+        run_headless(ticks, controller, seed, recorder, vectorized)
+    else:
+        quality = QUALITY_NAMES.index(args.quality) if args.quality else None
+        lod = LOD_NAMES.index(args.lod) if args.lod else None
+        main(seed, replay, recorder, args.render_fps, vectorized, args.dirty_rects, quality, lod)